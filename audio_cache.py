@@ -0,0 +1,110 @@
+import asyncio
+import os
+from collections import OrderedDict
+
+import aiohttp
+
+CACHE_DIR = os.environ.get("AUDIO_CACHE_DIR", "audio_cache")
+CACHE_MAX_BYTES = int(os.environ.get("AUDIO_CACHE_MAX_MB", 512)) * 1024 * 1024
+
+class AudioCache:
+    """
+    上傳音檔的本機 LRU 快取
+    以附件 ID + 大小作為 key，總容量超過上限時從最久沒播放的檔案開始刪除
+    快取未命中時 ffmpeg 直接串流網址、同時在背景下載一份，這首歌會從 Discord CDN 抓兩次；
+    以多一次下載換取第一次播放不必等整個檔案下載完，之後循環或重播才讀本機檔
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()   # key -> (路徑, 大小)，越後面越新
+        self._downloads = {}            # key -> 下載中的 Task
+        self._session = None
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(attachment_id, size):
+        return f"{attachment_id}_{size}"
+
+    def _load_index(self):
+        """重啟後沿用已下載的檔案，依修改時間排列 LRU 順序"""
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".part"):
+                os.remove(path)
+                continue
+            key = os.path.splitext(name)[0]
+            files.append((os.path.getmtime(path), key, path, os.path.getsize(path)))
+        for _, key, path, size in sorted(files):
+            self._entries[key] = (path, size)
+            self.total_bytes += size
+        self._evict()
+
+    def get(self, key):
+        """回傳已快取的本機路徑並標記為最近使用，沒有則回傳 None"""
+        entry = self._entries.get(key)
+        if entry is None or not os.path.exists(entry[0]):
+            if entry: self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def prefetch(self, url, key, filename, size):
+        """在背景下載音檔，重複呼叫只會下載一次"""
+        if key in self._entries or key in self._downloads: return
+        if size > self.max_bytes: return
+        task = asyncio.get_running_loop().create_task(self._download(url, key, filename, size))
+        self._downloads[key] = task
+        task.add_done_callback(lambda _: self._downloads.pop(key, None))
+
+    async def _download(self, url, key, filename, size):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        ext = os.path.splitext(filename)[1].lower()
+        path = os.path.join(self.directory, key + ext)
+        tmp = path + ".part"
+        try:
+            async with self._session.get(url) as resp:
+                resp.raise_for_status()
+                with open(tmp, "wb") as f:
+                    async for chunk in resp.content.iter_chunked(64 * 1024):
+                        f.write(chunk)
+            os.replace(tmp, path)
+        except asyncio.CancelledError:
+            if os.path.exists(tmp): os.remove(tmp)
+            raise
+        except Exception:
+            if os.path.exists(tmp): os.remove(tmp)
+            return
+        size = os.path.getsize(path)
+        self._entries[key] = (path, size)
+        self.total_bytes += size
+        self._evict(keep=key)
+
+    async def close(self):
+        """關閉時取消下載中的檔案並關閉 HTTP 連線"""
+        tasks = list(self._downloads.values())
+        for task in tasks: task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _drop(self, key):
+        path, size = self._entries.pop(key)
+        self.total_bytes -= size
+        try: os.remove(path)
+        except FileNotFoundError: pass
+
+    def _evict(self, keep=None):
+        for key in list(self._entries):
+            if self.total_bytes <= self.max_bytes: break
+            if key != keep: self._drop(key)
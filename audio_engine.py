@@ -0,0 +1,97 @@
+import asyncio
+import os
+import threading
+import discord
+
+# 播放引擎：pcm = FFmpegPCMAudio + Python 端調整音量 (預設)
+#          opus = FFmpegOpusAudio，音量交給 ffmpeg 濾鏡，bot 內不再解碼/編碼
+AUDIO_ENGINE = os.environ.get("AUDIO_ENGINE", "pcm").lower()
+# opus 引擎只有音量 100% 時才能直接轉送 Ogg/Opus 檔案，所以預設不調整音量
+DEFAULT_VOLUME = 1.0 if AUDIO_ENGINE == "opus" else 0.5
+
+FFMPEG_OPTIONS = {
+    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
+    'options': '-vn',
+}
+# 本機快取檔案不需要網路重連參數
+LOCAL_FFMPEG_OPTIONS = {
+    'before_options': '',
+    'options': '-vn',
+}
+
+FRAME_SECONDS = 0.02  # Discord 每個音訊影格 20 ms
+
+_ffmpeg_ready = False
+_ffmpeg_lock = threading.Lock()
+
+def ensure_ffmpeg():
+    """第一次使用時才把 static_ffmpeg 的執行檔加入 PATH (第一次執行可能需要下載)"""
+    global _ffmpeg_ready
+    if _ffmpeg_ready: return
+    with _ffmpeg_lock:
+        if not _ffmpeg_ready:
+            import static_ffmpeg
+            static_ffmpeg.add_paths()
+            _ffmpeg_ready = True
+
+async def prepare_ffmpeg():
+    """在執行緒中準備 ffmpeg，第一次播放前 await，避免下載或等鎖時卡住事件迴圈"""
+    if _ffmpeg_ready: return
+    await asyncio.get_running_loop().run_in_executor(None, ensure_ffmpeg)
+
+def is_ogg_opus(path):
+    """讀取 Ogg 檔頭判斷是否為 Opus 編碼 (Ogg 也可能是 Vorbis)"""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(64)
+    except OSError:
+        return False
+    return head.startswith(b"OggS") and b"OpusHead" in head
+
+class OpusTrackSource(discord.AudioSource):
+    """包裝 FFmpegOpusAudio，記錄已送出的影格數以換算目前播放位置"""
+
+    def __init__(self, inner, start=0.0):
+        self.inner = inner
+        self.start = start
+        self.frames = 0
+
+    def read(self):
+        data = self.inner.read()
+        if data: self.frames += 1
+        return data
+
+    def is_opus(self):
+        return True
+
+    def cleanup(self):
+        self.inner.cleanup()
+
+    @property
+    def position(self):
+        return self.start + self.frames * FRAME_SECONDS
+
+def build_source(url, path, volume, start=0.0):
+    """
+    建立播放來源，path 為本機快取路徑 (沒有快取則為 None)
+    start 為開始播放的秒數，用於 opus 引擎調整音量時從原位置重新啟動
+    會在事件迴圈上同步呼叫，呼叫前必須已經 await prepare_ffmpeg()
+    """
+    target = path or url
+    opts = LOCAL_FFMPEG_OPTIONS if path else FFMPEG_OPTIONS
+    before = opts['before_options']
+    if start > 0: before = f"-ss {start:.2f} {before}".strip()
+
+    if AUDIO_ENGINE != "opus":
+        audio = discord.FFmpegPCMAudio(target, before_options=before, options=opts['options'])
+        return discord.PCMVolumeTransformer(audio, volume=volume)
+
+    if path and volume == 1.0 and is_ogg_opus(path):
+        # 原本就是 Opus，直接封裝轉送不重新編碼
+        audio = discord.FFmpegOpusAudio(target, codec="copy", before_options=before, options=opts['options'])
+    else:
+        audio = discord.FFmpegOpusAudio(
+            target, before_options=before,
+            options=f"{opts['options']} -filter:a volume={volume:.2f}"
+        )
+    return OpusTrackSource(audio, start)
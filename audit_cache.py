@@ -0,0 +1,176 @@
+import bisect
+from collections import deque
+from itertools import islice
+
+AUDIT_LOG_LIMIT = 1000   # 每個伺服器保留的審核日誌筆數
+
+class AuditEntry:
+    __slots__ = ("id", "created_at", "user_id", "user", "action", "target", "reason")
+
+    def __init__(self, id, created_at, user_id, user, action, target, reason=None):
+        self.id = id
+        self.created_at = created_at   # UNIX 秒數
+        self.user_id = user_id
+        self.user = user
+        self.action = action           # AuditLogAction 名稱，例如 member_ban
+        self.target = target
+        self.reason = reason
+
+    @classmethod
+    def from_discord(cls, entry):
+        user = entry.user
+        return cls(
+            entry.id, entry.created_at.timestamp(), entry.user_id or (user.id if user else None),
+            str(user) if user else None, entry.action.name,
+            str(entry.target) if entry.target is not None else None, entry.reason
+        )
+
+    def to_list(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    @classmethod
+    def from_list(cls, data):
+        return cls(*data)
+
+class _Times:
+    """把依時間排序的紀錄當成時間序列給 bisect 使用，不另外複製"""
+    __slots__ = ("entries",)
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, index):
+        return self.entries[index].created_at
+
+class GuildAuditLog:
+    """
+    單一伺服器的審核日誌環狀緩衝區
+    依執行者與動作各建一份索引，查詢時從最小的候選集合開始過濾
+    紀錄依時間排序，時間範圍用二分搜尋
+    """
+
+    def __init__(self, limit=AUDIT_LOG_LIMIT):
+        self.limit = limit
+        self.entries = deque()
+        self.times = deque()       # 與 entries 對應的時間，用於二分搜尋
+        self.by_user = {}          # 執行者ID -> deque[AuditEntry]
+        self.by_action = {}        # 動作名稱 -> deque[AuditEntry]
+        self.ids = set()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry):
+        """加入一筆紀錄，回傳被擠出的舊紀錄 (沒有則為 None)"""
+        if entry.id in self.ids: return None
+        if self.entries and entry.created_at < self.times[-1]:
+            # 回補的舊資料，依時間插入 (不常發生)
+            pos = bisect.bisect_left(self.times, entry.created_at)
+            if pos == 0 and len(self.entries) >= self.limit: return None
+            self.entries.insert(pos, entry)
+            self.times.insert(pos, entry.created_at)
+            self._index(entry, sort=True)
+        else:
+            self.entries.append(entry)
+            self.times.append(entry.created_at)
+            self._index(entry)
+        self.ids.add(entry.id)
+        if len(self.entries) > self.limit:
+            return self._evict()
+        return None
+
+    def _index(self, entry, sort=False):
+        for index, key in ((self.by_user, entry.user_id), (self.by_action, entry.action)):
+            bucket = index.setdefault(key, deque())
+            bucket.append(entry)
+            if sort and len(bucket) > 1 and bucket[-2].created_at > entry.created_at:
+                index[key] = deque(sorted(bucket, key=lambda e: e.created_at))
+
+    def _evict(self):
+        old = self.entries.popleft()
+        self.times.popleft()
+        self.ids.discard(old.id)
+        for index, key in ((self.by_user, old.user_id), (self.by_action, old.action)):
+            bucket = index.get(key)
+            if bucket and bucket[0] is old: bucket.popleft()
+            elif bucket: bucket.remove(old)
+            if not bucket: index.pop(key, None)
+        return old
+
+    def query(self, user_id=None, action=None, since=None, until=None, limit=None):
+        """回傳符合條件的紀錄，新的在前"""
+        candidates = self.entries
+        if user_id is not None:
+            candidates = self.by_user.get(user_id, ())
+        if action is not None:
+            by_action = self.by_action.get(action, ())
+            if len(by_action) < len(candidates) or user_id is None:
+                candidates = by_action
+        # 候選集合都依時間排序，先用二分搜尋切出時間範圍，再由新到舊掃描
+        times = self.times if candidates is self.entries else _Times(candidates)
+        hi = len(times) if until is None else bisect.bisect_right(times, until)
+        lo = 0 if since is None else bisect.bisect_left(times, since)
+        results = []
+        for entry in islice(reversed(candidates), len(candidates) - hi, len(candidates) - lo):
+            if user_id is not None and entry.user_id != user_id: continue
+            if action is not None and entry.action != action: continue
+            results.append(entry)
+            if limit and len(results) >= limit: break
+        return results
+
+class AuditLogCache:
+    """
+    所有伺服器的審核日誌快取
+    由 on_audit_log_entry_create 寫入，store 不為 None 時同步寫進 SQLite (write-behind)
+    """
+
+    def __init__(self, store=None, limit=AUDIT_LOG_LIMIT):
+        self.store = store
+        self.limit = limit
+        self.guilds = {}
+        self.backfilled = set()   # 本程序已向 API 補過資料的伺服器
+        self.persisted_max = {}   # 伺服器ID -> 資料庫中最新一筆的 ID
+
+    def guild(self, guild_id):
+        log = self.guilds.get(guild_id)
+        if log is None:
+            log = self.guilds[guild_id] = GuildAuditLog(self.limit)
+        return log
+
+    def add(self, guild_id, entry):
+        evicted = self.guild(guild_id).add(entry)
+        if self.store:
+            self.store.set("audit", f"{guild_id}:{entry.id}", entry.to_list())
+            if evicted: self.store.delete("audit", f"{guild_id}:{evicted.id}")
+
+    def load(self, owns=None):
+        """從資料庫還原 (只在啟動時執行)，owns 用來過濾不屬於本程序分片的伺服器"""
+        if not self.store: return
+        rows = []
+        for key, data in self.store.load("audit").items():
+            guild_id = int(key.split(":", 1)[0])
+            if owns and not owns(guild_id): continue
+            rows.append((guild_id, AuditEntry.from_list(data)))
+        for guild_id, entry in sorted(rows, key=lambda r: r[1].created_at):
+            self.guild(guild_id).add(entry)
+            self.persisted_max[guild_id] = max(self.persisted_max.get(guild_id, 0), entry.id)
+
+    async def backfill(self, guild, limit=100):
+        """
+        每個程序第一次查詢某伺服器時從 API 補一次資料，之後都用本機資料
+        有從資料庫還原的紀錄時，補上最後一筆之後 (機器人離線期間) 的紀錄，最多保留上限筆數
+        """
+        if guild.id in self.backfilled: return
+        self.backfilled.add(guild.id)
+        after = self.persisted_max.get(guild.id)
+        try:
+            # 由新到舊抓，碰到資料庫已有的紀錄就停止；離線期間的紀錄可能比 limit 多，所以改用保留上限
+            async for entry in guild.audit_logs(limit=self.limit if after else limit):
+                if after and entry.id <= after: break
+                self.add(guild.id, AuditEntry.from_discord(entry))
+        except Exception:
+            # 沒有權限或 API 失敗，下次再試
+            self.backfilled.discard(guild.id)
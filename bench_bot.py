@@ -0,0 +1,647 @@
+"""
+bot.py 事件處理壓力測試 (不連網)
+以假的伺服器、成員、訊息與語音連線直接呼叫 bot.py 的處理函式，量測吞吐量、延遲百分位數與記憶體配置
+
+    python bench_bot.py                          # 全部情境
+    python bench_bot.py messages --rate 10000 --guilds 500 --seconds 3
+    python bench_bot.py joins --joins 5000 --guilds 50
+    python bench_bot.py stats --guilds 200 --members 2000
+    python bench_bot.py queue --guilds 200 --tracks 2000
+    MEMBER_CACHE_MODE=lite python bench_bot.py startup --guilds 100 --members 5000 --no-alloc
+    python bench_bot.py --no-alloc               # 不量記憶體配置 (tracemalloc 會拖慢執行)
+
+需要先安裝 requirements.txt (會 import bot.py 與 discord.py)，但不需要 DISCORD_TOKEN
+* 不會連上 Discord：DISCORD_TOKEN 會被清掉，bot.run 不會執行
+* 狀態資料庫與音檔快取放在暫存目錄，不影響正式資料
+* bot 沒有前綴指令，bot.process_commands 換成空函式，只量 bot.py 自己的程式
+* 播放來源換成假的 AudioSource，不會啟動 ffmpeg 或 yt-dlp
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from bench_filter import CHARSET
+
+# 必須在 import bot 之前設定
+_tmp = tempfile.mkdtemp(prefix="bench_bot_")
+os.environ.pop("DISCORD_TOKEN", None)
+os.environ["STATE_DB_PATH"] = os.path.join(_tmp, "state.db")
+os.environ["AUDIO_CACHE_DIR"] = os.path.join(_tmp, "audio_cache")
+os.environ.setdefault("MEMBER_CACHE_MODE", "full")
+
+try:
+    import discord
+    import bot as app
+except ImportError as e:
+    raise SystemExit(f"缺少套件 ({e})，請先 pip install -r requirements.txt")
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# =========================================================
+# ===== 假物件 =====
+# =========================================================
+_ids = iter(range(10**15, 10**16))
+
+def next_id():
+    return next(_ids)
+
+class FakeAsset:
+    url = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+class FakeUser:
+    def __init__(self, name="bench-bot"):
+        self.id = next_id()
+        self.name = name
+        self.mention = f"<@{self.id}>"
+
+    def mentioned_in(self, message):
+        return False
+
+class FakeMember(discord.Member):
+    """繼承 discord.Member 讓 isinstance 檢查成立 (過濾器禁言要用)，屬性全部改成一般值"""
+    id = guild = bot = status = mention = display_name = display_avatar = None
+
+    def __init__(self, guild, is_bot=False, online=True):
+        self.id = next_id()
+        self.guild = guild
+        self.bot = is_bot
+        self.status = discord.Status.online if online else discord.Status.offline
+        self.mention = f"<@{self.id}>"
+        self.display_name = f"member{self.id % 10000}"
+        self.display_avatar = FakeAsset
+
+    def __repr__(self):
+        return f"<FakeMember {self.id}>"
+
+    def __hash__(self):
+        return hash(self.id)
+
+    async def timeout(self, duration, reason=None):
+        calls["timeout"] += 1
+
+class FakeChannel:
+    def __init__(self, guild, name="general"):
+        self.id = next_id()
+        self.guild = guild
+        self.name = name
+
+    async def send(self, content=None, embed=None, **kwargs):
+        calls["send"] += 1
+
+    async def delete_messages(self, messages):
+        calls["bulk_delete"] += 1
+
+    async def edit(self, name=None, **kwargs):
+        calls["rename"] += 1
+        self.name = name
+
+class FakeVoiceChannel(FakeChannel):
+    pass
+
+class FakeGuild:
+    def __init__(self, name, members=0, bot_ratio=0.05, online_ratio=0.3, rng=random):
+        self.id = next_id()
+        self.name = name
+        self.roles = []
+        self.voice_client = None
+        self.system_channel = FakeChannel(self, "welcome")
+        self.text_channel = FakeChannel(self)
+        self.log_channel = FakeChannel(self, "log")
+        self.voice_channel = FakeVoiceChannel(self, "voice")
+        self.members = [
+            FakeMember(self, rng.random() < bot_ratio, rng.random() < online_ratio) for _ in range(members)
+        ]
+        self.member_count = members
+
+    def channels(self):
+        return [self.system_channel, self.text_channel, self.log_channel, self.voice_channel]
+
+class FakeMessage:
+    __slots__ = ("id", "guild", "channel", "author", "content", "mention_everyone")
+
+    def __init__(self, guild, channel, author, content):
+        self.id = next_id()
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.mention_everyone = False
+
+    async def delete(self):
+        calls["delete"] += 1
+
+class FakeSource(discord.AudioSource):
+    def read(self):
+        return b""
+
+    def cleanup(self):
+        pass
+
+class FakeVoiceClient:
+    """只記錄狀態，不送出音訊；播完由測試直接呼叫 play_next 模擬 after 回呼"""
+
+    def __init__(self, guild, channel):
+        self.guild = guild
+        self.channel = channel
+        self.source = None
+        self._playing = False
+
+    def is_connected(self):
+        return True
+
+    def is_playing(self):
+        return self._playing
+
+    def is_paused(self):
+        return False
+
+    def play(self, source, after=None):
+        self.source = source
+        self._playing = True
+        calls["play"] += 1
+
+    def stop(self):
+        self._playing = False
+
+    def pause(self):
+        pass
+
+    def resume(self):
+        pass
+
+    async def disconnect(self, force=False):
+        self.guild.voice_client = None
+
+calls = dict.fromkeys(("send", "delete", "bulk_delete", "timeout", "rename", "play"), 0)
+
+# =========================================================
+# ===== 模擬 gateway (startup 情境) =====
+# =========================================================
+# 直接把 READY / GUILD_CREATE / GUILD_MEMBERS_CHUNK 的資料交給 discord.py 的 ConnectionState 解析，
+# 成員快取、分段下載與等待 ready 的流程都是 discord.py 原本的程式碼
+CHUNK_SIZE = 1000        # Discord 每段最多 1000 位成員
+LARGE_THRESHOLD = 250    # discord.py IDENTIFY 預設的 large_threshold
+
+def _everyone(guild_id):
+    return {"id": str(guild_id), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+            "hoist": False, "managed": False, "mentionable": False, "flags": 0}
+
+class GatewayGuild:
+    """一個模擬伺服器的成員規則：第 i 位成員的 ID 為 base + i，每 20 位 1 個機器人、30% 在線、1% 在語音"""
+
+    def __init__(self, members):
+        self.id = next_id()
+        self.text_id = next_id()
+        self.voice_id = next_id()
+        self.count = members
+        self.base = next_id() * 1000
+
+    def is_bot(self, i): return i % 20 == 0
+    def is_online(self, i): return i % 10 < 3
+    def in_voice(self, i): return i % 100 == 1
+
+    def member(self, i):
+        uid = self.base + i
+        return {"user": {"id": str(uid), "username": f"member{i}", "global_name": None, "avatar": None,
+                         "discriminator": "0", "public_flags": 0, "bot": self.is_bot(i)},
+                "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0}
+
+    def presence(self, i):
+        return {"user": {"id": str(self.base + i)}, "status": "online",
+                "client_status": {"desktop": "online"}, "activities": []}
+
+    def guild_create(self, bot_user, presences):
+        """
+        GUILD_CREATE 內附的成員同 Discord 的規則：
+        有 presences intent 時小伺服器附全部成員、大伺服器只附在線成員；沒有時只附機器人自己與語音中的成員
+        """
+        large = self.count > LARGE_THRESHOLD
+        if presences and not large: listed = range(self.count)
+        elif presences: listed = [i for i in range(self.count) if self.is_online(i) or self.in_voice(i)]
+        else: listed = [i for i in range(self.count) if self.in_voice(i)]
+        me = {"user": bot_user, "roles": [], "joined_at": "2024-01-01T00:00:00+00:00",
+              "deaf": False, "mute": False, "flags": 0}
+        return {
+            "id": str(self.id), "name": f"guild{self.id % 10000}", "owner_id": str(self.base),
+            "member_count": self.count + 1, "large": large, "unavailable": False,
+            "roles": [_everyone(self.id)], "emojis": [], "stickers": [], "features": [], "threads": [],
+            "stage_instances": [], "guild_scheduled_events": [],
+            "channels": [
+                {"id": str(self.text_id), "type": 0, "name": "general", "position": 0, "permission_overwrites": []},
+                {"id": str(self.voice_id), "type": 2, "name": "voice", "position": 1, "permission_overwrites": [],
+                 "bitrate": 64000, "user_limit": 0},
+            ],
+            "members": [me] + [self.member(i) for i in listed],
+            "presences": [self.presence(i) for i in listed if self.is_online(i)] if presences else [],
+            "voice_states": [
+                {"user_id": str(self.base + i), "channel_id": str(self.voice_id), "session_id": "bench",
+                 "deaf": False, "mute": False, "self_deaf": False, "self_mute": False, "self_video": False,
+                 "suppress": False}
+                for i in range(self.count) if self.in_voice(i)
+            ],
+        }
+
+class FakeGateway:
+    """
+    代替 DiscordWebSocket 回應 REQUEST_GUILD_MEMBERS
+    送出請求前經過 discord.py 的 GatewayRatelimiter (每 60 秒 110 次)，Discord 端回應延遲 rtt 秒
+    """
+
+    def __init__(self, state, guilds, rtt):
+        self.state = state
+        self.guilds = {g.id: g for g in guilds}
+        self.rtt = rtt
+        self.ratelimiter = discord.gateway.GatewayRatelimiter()
+        self.requests = 0
+        self.chunks = 0
+        self._tasks = set()
+
+    async def request_chunks(self, guild_id, query=None, *, limit, user_ids=None, presences=False, nonce=None):
+        await self.ratelimiter.block()
+        self.requests += 1
+        task = asyncio.get_running_loop().create_task(self._reply(self.guilds[guild_id], nonce))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _reply(self, guild, nonce):
+        await asyncio.sleep(self.rtt)
+        count = max((guild.count + CHUNK_SIZE - 1) // CHUNK_SIZE, 1)
+        for index in range(count):
+            members = [guild.member(i) for i in range(index * CHUNK_SIZE, min((index + 1) * CHUNK_SIZE, guild.count))]
+            self.state.parse_guild_members_chunk({"guild_id": str(guild.id), "members": members,
+                                                  "chunk_index": index, "chunk_count": count, "nonce": nonce})
+            self.chunks += 1
+            await asyncio.sleep(0)
+
+# =========================================================
+# ===== 把 bot.py 接到假物件上 =====
+# =========================================================
+world = {"guilds": {}, "channels": {}, "user": FakeUser()}
+
+class HarnessBot(type(app.bot)):
+    """只覆寫 bot.py 會讀到的屬性，其餘沿用 discord.py 原本的實作"""
+
+    @property
+    def user(self):
+        return world["user"]
+
+    @property
+    def guilds(self):
+        return list(world["guilds"].values())
+
+    @property
+    def voice_clients(self):
+        return [g.voice_client for g in world["guilds"].values() if g.voice_client]
+
+    @property
+    def latency(self):
+        return 0.05
+
+async def _no_commands(message):
+    return None
+
+async def _fetch_guild(guild_id, with_counts=True):
+    guild = world["guilds"][guild_id]
+    class Counts:
+        approximate_member_count = guild.member_count
+        approximate_presence_count = sum(1 for m in guild.members if m.status != discord.Status.offline)
+    return Counts
+
+def install(loop):
+    app.bot.__class__ = HarnessBot
+    app.bot.loop = loop
+    app.bot._connection.loop = loop
+    app.bot.get_guild = world["guilds"].get
+    app.bot.get_channel = world["channels"].get
+    app.bot.fetch_guild = _fetch_guild
+    app.bot.process_commands = _no_commands
+    # 播放不啟動 ffmpeg / yt-dlp
+    app.build_source = lambda url, path, volume, start=0.0: FakeSource()
+    app.ytdl.cached_track = lambda url: {"stream_url": url}
+    app.ytdl.prefetch = lambda url: None
+
+def reset_world():
+    world["guilds"].clear()
+    world["channels"].clear()
+    app.filter_configs.clear()
+    app.stats_channels.clear()
+    app.queues.clear()
+    app.member_counters.clear()
+    app.stream_governor.active.clear()
+    app.stream_governor.waiting.clear()
+    app.welcome_buffer = type(app.welcome_buffer)()
+    for key in calls: calls[key] = 0
+
+def make_guilds(count, members, rng):
+    guilds = []
+    for i in range(count):
+        guild = FakeGuild(f"guild{i}", members, rng=rng)
+        world["guilds"][guild.id] = guild
+        for ch in guild.channels(): world["channels"][ch.id] = ch
+        guilds.append(guild)
+    return guilds
+
+# =========================================================
+# ===== 統計 =====
+# =========================================================
+def percentile(sorted_values, p):
+    if not sorted_values: return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
+
+def report_latency(title, latencies, elapsed):
+    lat = sorted(latencies)
+    ms = lambda v: f"{v * 1000:.3f}"
+    print(f"  {title}: {len(lat):,} 次 / {elapsed:.2f} 秒 = {len(lat) / elapsed if elapsed else 0:,.0f} 次/秒")
+    print(f"    延遲 ms  p50 {ms(percentile(lat, 50))} | p95 {ms(percentile(lat, 95))} | "
+          f"p99 {ms(percentile(lat, 99))} | 最大 {ms(lat[-1] if lat else 0)}")
+
+def report_alloc(snapshot_before, snapshot_after, peak, top=5):
+    print(f"  記憶體配置: 峰值 {peak / 1024:,.0f} KB")
+    stats = snapshot_after.compare_to(snapshot_before, "lineno")
+    shown = 0
+    for stat in stats:
+        frame = stat.traceback[0]
+        if not frame.filename.startswith(REPO_DIR) or frame.filename == __file__: continue
+        print(f"    {stat.size_diff / 1024:>+9,.1f} KB {stat.count_diff:>+8,} 個  "
+              f"{os.path.relpath(frame.filename, REPO_DIR)}:{frame.lineno}")
+        shown += 1
+        if shown >= top: break
+
+async def run_with_alloc(fn, args):
+    """用 tracemalloc 再跑一次 (規模縮小)，只看 bot 程式碼配置了多少記憶體"""
+    reset_world()
+    tracemalloc.start(1)
+    before = tracemalloc.take_snapshot()
+    await fn(args, quiet=True)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    report_alloc(before, after, peak)
+
+# =========================================================
+# ===== 情境 =====
+# =========================================================
+async def bench_messages(args, quiet=False):
+    """固定速率 (open loop) 送出訊息給 on_message，延遲包含排隊時間，超過處理能力時會明顯上升"""
+    rng = random.Random(args.seed)
+    guilds = make_guilds(args.guilds, args.authors, rng)
+    keywords = list(app.COMMON_PROFANITY)
+    for guild in guilds:
+        config = app.get_filter_config(guild.id)
+        config["enabled"] = True
+        config["log_channel_id"] = guild.log_channel.id
+
+    total = int(args.rate * args.seconds) if args.rate else args.messages
+    if quiet: total = max(total // 10, 1)
+    messages = []
+    for _ in range(total):
+        guild = rng.choice(guilds)
+        content = "".join(rng.choice(CHARSET) for _ in range(rng.randint(5, 120)))
+        if rng.random() < args.hit_ratio: content += rng.choice(keywords)
+        messages.append(FakeMessage(guild, guild.text_channel, rng.choice(guild.members), content))
+
+    app.moderation.start()
+    latencies = []
+    loop = asyncio.get_running_loop()
+
+    async def handle(message, scheduled):
+        await app.on_message(message)
+        latencies.append(time.perf_counter() - scheduled)
+
+    start = time.perf_counter()
+    tasks = []
+    if args.rate:
+        tick = 0.01
+        per_tick = max(int(args.rate * tick), 1)
+        for i in range(0, total, per_tick):
+            scheduled = start + (i / args.rate)
+            delay = scheduled - time.perf_counter()
+            if delay > 0: await asyncio.sleep(delay)
+            for message in messages[i:i + per_tick]:
+                tasks.append(loop.create_task(handle(message, scheduled)))
+    else:
+        # 不限速：全部訊息一次排入事件迴圈，延遲主要是排隊時間
+        for message in messages:
+            tasks.append(loop.create_task(handle(message, time.perf_counter())))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    await app.moderation.queue.join()
+    drained = time.perf_counter() - start
+
+    if quiet: return
+    print(f"[messages] {args.guilds} 個伺服器 | 目標 {args.rate or '不限'} 則/秒 | 命中率 {args.hit_ratio:.1%}")
+    report_latency("on_message", latencies, elapsed)
+    print(f"  處分佇列清空: {drained:.2f} 秒 | 刪除 {calls['delete']} | 批次刪除 {calls['bulk_delete']} | 禁言 {calls['timeout']}")
+
+async def bench_joins(args, quiet=False):
+    """短時間大量加入 (突襲)，量 on_member_join 與歡迎訊息合併"""
+    rng = random.Random(args.seed)
+    guilds = make_guilds(args.guilds, args.members, rng)
+    for guild in guilds: app.get_member_counter(guild)
+    total = args.joins // 10 if quiet else args.joins
+
+    joins = []
+    for _ in range(total):
+        guild = rng.choice(guilds)
+        member = FakeMember(guild, rng.random() < 0.05)
+        guild.members.append(member)
+        guild.member_count += 1
+        joins.append(member)
+
+    latencies = []
+    start = time.perf_counter()
+    for member in joins:
+        t = time.perf_counter()
+        await app.on_member_join(member)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0)   # 讓立即送出的歡迎卡片跑完
+
+    if quiet: return
+    pending = sum(len(buf.pending) + buf.overflow for buf in app.welcome_buffer._guilds.values())
+    print(f"[joins] {args.guilds} 個伺服器 | {total:,} 位成員加入")
+    report_latency("on_member_join", latencies, elapsed)
+    print(f"  已送出歡迎卡片 {app.welcome_buffer.sent_cards} 則 | 等待合併 {pending} 位 | 頻道訊息 {calls['send']} 則")
+
+async def bench_stats(args, quiet=False):
+    """update_member_stats：第一次需要完整掃描成員，之後只讀計數器；中間穿插狀態更新"""
+    rng = random.Random(args.seed)
+    guilds = make_guilds(args.guilds // 10 if quiet else args.guilds, args.members, rng)
+    for guild in guilds:
+        ch = {key: FakeVoiceChannel(guild, key) for key in ("total", "humans", "online", "bots")}
+        for c in ch.values(): world["channels"][c.id] = c
+        app.stats_channels[guild.id] = {key: c.id for key, c in ch.items()}
+
+    app.rename_scheduler.start()
+    passes = []
+    presence = []
+    for n in range(args.passes):
+        t = time.perf_counter()
+        await app.update_member_stats.coro()
+        passes.append(time.perf_counter() - t)
+        # 兩次統計之間模擬一批上下線
+        for _ in range(args.presence):
+            guild = rng.choice(guilds)
+            member = rng.choice(guild.members)
+            before = FakeMember.__new__(FakeMember)
+            before.status = member.status
+            member.status = discord.Status.offline if member.status != discord.Status.offline else discord.Status.online
+            t = time.perf_counter()
+            await app.on_presence_update(before, member)
+            presence.append(time.perf_counter() - t)
+
+    if quiet: return
+    print(f"[stats] {len(guilds)} 個伺服器 x {args.members:,} 位成員 | 模式 {app.MEMBER_CACHE_MODE}")
+    for n, sec in enumerate(passes, start=1):
+        print(f"  第 {n} 次 update_member_stats: {sec * 1000:,.1f} ms")
+    report_latency("on_presence_update", presence, sum(presence))
+    print(f"  改名排程: {app.rename_scheduler.stats}")
+
+async def bench_queue(args, quiet=False):
+    """MusicManager：每個伺服器一份長清單，反覆模擬歌曲播完 (play_next) 與控制面板操作"""
+    rng = random.Random(args.seed)
+    guilds = make_guilds(args.guilds // 10 if quiet else args.guilds, 0, rng)
+    app.stream_governor.max_streams = args.max_streams or len(guilds)
+    managers = []
+    for guild in guilds:
+        guild.voice_client = FakeVoiceClient(guild, guild.voice_channel)
+        mgr = app.queues[guild.id] = app.MusicManager(guild.id)
+        mgr.vc = guild.voice_client
+        mgr.mode = rng.choice(("none", "all"))
+        mgr.queue.extend(
+            app.Track(f"https://example.com/watch?v={guild.id}-{i}", f"track {i}", rng.randint(60, 600), "bench")
+            for i in range(args.tracks)
+        )
+        managers.append(mgr)
+
+    steps = args.steps // 10 if quiet else args.steps
+    play_lat, embed_lat, jump_lat = [], [], []
+    start = time.perf_counter()
+    for _ in range(steps):
+        for mgr in managers:
+            mgr.vc._playing = False   # 模擬歌曲播完
+            t = time.perf_counter()
+            mgr.play_next()
+            play_lat.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+
+    for mgr in managers:
+        t = time.perf_counter()
+        mgr.get_status_embed(rng.randrange(mgr.page_count()))
+        embed_lat.append(time.perf_counter() - t)
+        if len(mgr.queue) > 1:
+            t = time.perf_counter()
+            mgr.jump(rng.randrange(len(mgr.queue)))
+            jump_lat.append(time.perf_counter() - t)
+
+    if quiet: return
+    governor = app.stream_governor
+    print(f"[queue] {len(guilds)} 個伺服器 x {args.tracks:,} 首 | 轉碼名額 {governor.max_streams}")
+    report_latency("play_next", play_lat, elapsed)
+    report_latency("get_status_embed", embed_lat, sum(embed_lat))
+    report_latency("jump", jump_lat, sum(jump_lat))
+    print(f"  開始播放 {calls['play']} 次 | 佔用名額 {len(governor.active)} | 排隊 {len(governor.waiting)}")
+
+async def bench_startup(args, quiet=False):
+    """
+    從 READY 到 on_ready 的時間與成員快取佔用的記憶體，依 MEMBER_CACHE_MODE 比較 full / lite
+    RSS 是整個程序的數值，要比較兩種模式請各自單獨執行：MEMBER_CACHE_MODE=lite python bench_bot.py startup
+    """
+    import psutil
+    state = app.bot._connection
+    guilds = [GatewayGuild(args.members) for _ in range(args.guilds // 10 if quiet else args.guilds)]
+    gateway = FakeGateway(state, guilds, args.gateway_rtt)
+    ready = asyncio.Event()
+
+    async def on_ready():
+        ready.set()
+
+    # bot.py 的 on_ready 會同步指令、啟動背景工作，這裡只量 discord.py 什麼時候觸發 ready
+    handler = app.bot.on_ready
+    app.bot.on_ready = on_ready
+    app.bot.ws = gateway
+    if app.bot._ready is discord.utils.MISSING: app.bot._ready = asyncio.Event()
+    bot_user = {"id": str(next_id()), "username": "bench-bot", "global_name": None, "avatar": None,
+                "discriminator": "0", "bot": True}
+    proc = psutil.Process()
+    gc.collect()
+    rss_before = proc.memory_info().rss
+    try:
+        start = time.perf_counter()
+        state.parse_ready({"v": 10, "user": bot_user, "session_id": "bench", "application": {"id": bot_user["id"], "flags": 0},
+                           "guilds": [{"id": str(g.id), "unavailable": True} for g in guilds]})
+        for guild in guilds:
+            state.parse_guild_create(guild.guild_create(bot_user, state._intents.presences))
+            await asyncio.sleep(0)
+        guilds_received = time.perf_counter() - start
+        await ready.wait()
+        elapsed = time.perf_counter() - start
+    finally:
+        app.bot.on_ready = handler
+        app.bot.ws = None
+    gc.collect()
+    rss_after = proc.memory_info().rss
+    cached = sum(len(g.members) for g in state.guilds)
+    total = sum(g.count + 1 for g in guilds)
+    state.clear()
+
+    if quiet: return
+    print(f"[startup] {len(guilds)} 個伺服器 x {args.members:,} 位成員 | 模式 {app.MEMBER_CACHE_MODE} | "
+          f"gateway 回應延遲 {args.gateway_rtt * 1000:.0f} ms")
+    print(f"  READY -> on_ready: {elapsed:.2f} 秒 (GUILD_CREATE 全部送達 {guilds_received:.2f} 秒，"
+          f"discord.py 在最後一個 GUILD_CREATE 後至少再等 {state.guild_ready_timeout:.1f} 秒)")
+    print(f"  成員分段請求 {gateway.requests} 次 / 收到 {gateway.chunks} 段")
+    print(f"  快取成員 {cached:,} / {total:,} 位 | RSS {rss_before / 1024 / 1024:,.1f} -> "
+          f"{rss_after / 1024 / 1024:,.1f} MB ({(rss_after - rss_before) / 1024 / 1024:+,.1f} MB)")
+
+SCENARIOS = {
+    "messages": bench_messages,
+    "joins": bench_joins,
+    "stats": bench_stats,
+    "queue": bench_queue,
+    "startup": bench_startup,
+}
+
+async def main_async(args):
+    install(asyncio.get_running_loop())
+    for name in args.scenarios or list(SCENARIOS):
+        reset_world()
+        await SCENARIOS[name](args)
+        if not args.no_alloc: await run_with_alloc(SCENARIOS[name], args)
+        print()
+
+def main():
+    parser = argparse.ArgumentParser(description="bot.py 事件處理壓力測試 (不連網)")
+    parser.add_argument("scenarios", nargs="*", metavar="情境", help=f"要跑的情境，預設全部: {', '.join(SCENARIOS)}")
+    parser.add_argument("--guilds", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=724)
+    parser.add_argument("--no-alloc", action="store_true", help="不以 tracemalloc 量測記憶體配置")
+    # messages
+    parser.add_argument("--rate", type=float, default=10000, help="每秒訊息數，0 代表不限速")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--messages", type=int, default=30000, help="--rate 0 時送出的訊息數")
+    parser.add_argument("--authors", type=int, default=50, help="每個伺服器發言的成員數")
+    parser.add_argument("--hit-ratio", type=float, default=0.01)
+    # joins / stats
+    parser.add_argument("--joins", type=int, default=5000)
+    parser.add_argument("--members", type=int, default=200, help="每個伺服器原有的成員數")
+    parser.add_argument("--passes", type=int, default=3)
+    parser.add_argument("--presence", type=int, default=20000, help="每次統計之間的狀態更新數")
+    # queue
+    parser.add_argument("--tracks", type=int, default=2000)
+    parser.add_argument("--steps", type=int, default=200, help="每個伺服器模擬播完幾首")
+    parser.add_argument("--max-streams", type=int, default=0, help="轉碼名額，0 代表與伺服器數相同")
+    # startup
+    parser.add_argument("--gateway-rtt", type=float, default=0.1, help="成員分段請求的回應延遲 (秒)")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown: parser.error(f"未知的情境: {', '.join(unknown)}")
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
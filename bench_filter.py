@@ -0,0 +1,82 @@
+"""
+過濾器效能測試
+比較舊的 any(word in content) 逐一掃描與 KeywordMatcher 的吞吐量
+
+    python bench_filter.py
+    python bench_filter.py --messages 50000 --sizes 40 5000
+"""
+import argparse
+import random
+import time
+
+from word_filter import COMMON_PROFANITY, KeywordMatcher, normalize
+
+# 常用中文字 + 英數，用來產生訊息與補足關鍵字
+CHARSET = (
+    "的一是不了人我在有他這中大來上個國到說們為子和你地出道也時年得就那要下以生會自著去之過家學對可她裡後小麼心多天而能好都然沒日於起還發成事只作當想看文無開手十用主行方又如前所本見經頭面公同三已老從動兩長"
+    "abcdefghijklmnopqrstuvwxyz0123456789 "
+)
+
+def make_keywords(count, rng):
+    words = list(COMMON_PROFANITY[:count])
+    seen = set(words)
+    while len(words) < count:
+        word = "".join(rng.choice(CHARSET[:120]) for _ in range(rng.randint(3, 6)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+def make_messages(count, keywords, rng, hit_ratio):
+    messages = []
+    for _ in range(count):
+        msg = "".join(rng.choice(CHARSET) for _ in range(rng.randint(5, 120)))
+        if rng.random() < hit_ratio:
+            pos = rng.randint(0, len(msg))
+            msg = msg[:pos] + rng.choice(keywords) + msg[pos:]
+        messages.append(msg)
+    return messages
+
+def run(fn, messages):
+    start = time.perf_counter()
+    hits = 0
+    for msg in messages:
+        if fn(msg):
+            hits += 1
+    return time.perf_counter() - start, hits
+
+def bench(size, n_messages, hit_ratio, seed):
+    rng = random.Random(seed)
+    keywords = make_keywords(size, rng)
+    messages = make_messages(n_messages, keywords, rng, hit_ratio)
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher(keywords)
+    matcher.search("")
+    build = time.perf_counter() - start
+
+    # 舊做法：每個關鍵字各掃一次訊息 (此處補上相同的正規化，讓結果可比較)
+    def naive(msg):
+        text = normalize(msg)
+        return any(word in text for word in keywords)
+    t_naive, h_naive = run(naive, messages)
+    t_ac, h_ac = run(matcher.search, messages)
+    if h_naive != h_ac:
+        raise SystemExit(f"結果不一致: any()={h_naive} matcher={h_ac}")
+
+    print(f"[{size} 個關鍵字] 建表 {build * 1000:.1f} ms | 命中 {h_ac}/{n_messages}")
+    print(f"  any(word in content): {n_messages / t_naive:>12,.0f} 則/秒")
+    print(f"  KeywordMatcher      : {n_messages / t_ac:>12,.0f} 則/秒  ({t_naive / t_ac:.1f}x)")
+
+def main():
+    parser = argparse.ArgumentParser(description="不雅詞彙過濾器效能測試")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[40, 5000])
+    parser.add_argument("--hit-ratio", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=724)
+    args = parser.parse_args()
+    for size in args.sizes:
+        bench(size, args.messages, args.hit_ratio, args.seed)
+
+if __name__ == "__main__":
+    main()
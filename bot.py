@@ -1,16 +1,58 @@
+import time
+BOOT_STARTED = time.perf_counter()  # 啟動計時起點，放在所有 import 之前
+
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 import os
-import time
+import math
+import json
+import hashlib
 import asyncio
 import datetime
-import psutil
-import static_ffmpeg
-from server import keep_alive
+import atexit
+from collections import deque
+from server import HealthServer
+from word_filter import COMMON_PROFANITY, KeywordMatcher
+from member_stats import LOW_MEMORY, MEMBER_CACHE_MODE, member_counters, get_member_counter, refresh_approximate_counter
+from rename_scheduler import ChannelRenameScheduler
+from voice_supervisor import ReconnectSupervisor
+from audio_cache import AudioCache
+from audio_engine import DEFAULT_VOLUME, OpusTrackSource, build_source, ensure_ffmpeg, prepare_ffmpeg
+from ytdl_source import YTDLResolver
+from music_queue import Track, TrackQueue, format_duration
+from state_store import StateStore
+from metrics import REGISTRY, loop_lag, monitor_loop_lag
+from moderation import ModerationPipeline
+from welcome import WelcomeBuffer
+from audit_cache import AUDIT_LOG_LIMIT, AuditEntry, AuditLogCache
+from stream_governor import IDLE_DISCONNECT, StreamGovernor
+from resource_monitor import ResourceSampler
+from sharding import CLUSTER_ID, IS_PRIMARY, SHARDED, bot_options, owns_guild
 import re
 import datetime
 
+# ===== 啟動計時 =====
+startup_marks = {}
+
+def mark_startup(phase):
+    """記錄從程式啟動到各階段經過的秒數，同一階段只記第一次"""
+    startup_marks.setdefault(phase, time.perf_counter() - BOOT_STARTED)
+
+def current_rss_mb():
+    import psutil
+    return psutil.Process().memory_info().rss / 1024 / 1024
+
+def startup_report():
+    report = "啟動耗時: " + " | ".join(f"{phase} {sec:.2f}s" for phase, sec in startup_marks.items())
+    return f"{report} | 記憶體 {current_rss_mb():.0f} MB | 成員快取: {MEMBER_CACHE_MODE}"
+
+mark_startup("imports")
+
+# yt-dlp 子行程必須在任何執行緒 (狀態寫入、執行緒池、語音) 啟動前 fork，見 ytdl_source.py
+ytdl = YTDLResolver()
+ytdl.start()
+
 def parse_duration(time_str: str) -> int:
     """
     將類似 '1d2h30m10s' 的字串轉成秒數
@@ -29,38 +71,72 @@ def parse_duration(time_str: str) -> int:
     )
     return total_seconds
 
-
-# 初始化 FFMPEG
-static_ffmpeg.add_paths()
-
-# ===== 啟動 Web 服務 =====
-keep_alive()
+# ffmpeg 路徑在 on_ready 時於背景初始化，播放前再 await prepare_ffmpeg() 確認已完成
 
 # ===== Intents 設定 =====
 intents = discord.Intents.default()
 intents.message_content = True
 intents.voice_states = True
 intents.members = True
-intents.presences = True
-
-bot = commands.Bot(command_prefix="!", intents=intents)
+# 精簡模式不接收狀態更新，在線人數改用 API 的概略值
+intents.presences = not LOW_MEMORY
+
+if LOW_MEMORY:
+    # 只快取在語音頻道中的成員 (語音掛機與播放需要)，其他成員用到時才由互動資料或 API 取得
+    member_cache_flags = discord.MemberCacheFlags.none()
+    member_cache_flags.voice = True
+else:
+    member_cache_flags = discord.MemberCacheFlags.from_intents(intents)
+
+# 在指令執行前記下開始時間，完成或失敗時記錄指令耗時
+class InstrumentedTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction):
+        interaction.extras["started_at"] = time.perf_counter()
+        return True
+
+    async def on_error(self, interaction, error):
+        observe_command(interaction, "error")
+        await super().on_error(interaction, error)
+
+# 狀態放在建構參數，gateway 重新 IDENTIFY 時會自動帶上，不需要每次 on_ready 重設
+# 分片模式 (SHARDED / SHARD_COUNT，見 sharding.py) 改用 AutoShardedBot
+# 超過 60 秒的 429 直接丟出 RateLimited，由呼叫端重新排程 (例如頻道改名一次可能要等 10 分鐘)
+# 這個設定套用在所有 REST 呼叫；RateLimited 不是 HTTPException 的子類別，捕捉 API 錯誤時要一併列出
+bot_cls = commands.AutoShardedBot if SHARDED else commands.Bot
+bot = bot_cls(
+    command_prefix="!", intents=intents, tree_cls=InstrumentedTree,
+    status=discord.Status.online, activity=discord.Game(name="24/7 掛機中"),
+    chunk_guilds_at_startup=not LOW_MEMORY, member_cache_flags=member_cache_flags, max_ratelimit_timeout=60,
+    **bot_options()
+)
 tree = bot.tree
 
 # ===== 成員加入歡迎卡片 =====
+# 加入速度過快時 (突襲、大量邀請) 合併成一則歡迎訊息，詳見 welcome.py
+welcome_buffer = WelcomeBuffer()
+
 @bot.event
 async def on_member_join(member):
-    channel = member.guild.system_channel
-    if not channel:
-        return
+    counter = member_counters.get(member.guild.id)
+    if counter: counter.member_join(member)
 
-    embed = discord.Embed(
-        description=f"你好 歡迎加入 {member.guild.name}\n\n{member.mention}\n\n你是本伺服器的第 {member.guild.member_count} 位成員",
-        color=0x2b2d31
-    )
+    welcome_buffer.member_join(member)
 
-    embed.set_thumbnail(url=member.display_avatar.url)
+# ===== 人數統計計數 =====
+@bot.event
+async def on_member_remove(member):
+    counter = member_counters.get(member.guild.id)
+    if counter: counter.member_remove(member)
+
+@bot.event
+async def on_presence_update(before, after):
+    counter = member_counters.get(after.guild.id)
+    if counter: counter.presence_update(before, after)
 
-    await channel.send(embed=embed)
+async def load_member_counter(guild):
+    """完整快取模式直接讀計數器，精簡模式向 API 取得概略人數"""
+    if LOW_MEMORY: return await refresh_approximate_counter(bot, guild)
+    return get_member_counter(guild)
 
 # ===== 資料儲存 =====
 stay_channels = {}
@@ -68,28 +144,88 @@ stay_since = {}
 tag_targets = {}
 stats_channels = {}
 queues = {} 
-
-# ===== 擴充後的不雅語言詞庫 =====
-COMMON_PROFANITY = [
-    "幹", "靠", "屁", "垃圾", "智障", "腦癱", "死全家", "孤兒", 
-    "廢物", "去死", "操你媽", "你媽死了", "尼哥", "畜生", "雜種", 
-    "低能兒", "白癡", "腦殘", "傻逼", "機掰", "雞掰", "賤人", "賤貨",
-    "操", "肏", "幹你娘", "靠北", "靠腰", "三小", "幹林娘", "機歪",
-    "支那", "下流", "無恥", "欠幹", "狗娘養的", "尼瑪"
-]
-
-# 不雅語言偵測設定
-filter_config = {
-    "enabled": False,
-    "log_channel_id": None,
-    "keywords": COMMON_PROFANITY
-}
+rename_scheduler = ChannelRenameScheduler()
+voice_supervisor = ReconnectSupervisor(bot, stay_channels)
+# 所有伺服器共用的 ffmpeg 轉碼名額 (MAX_STREAMS)
+stream_governor = StreamGovernor()
+
+# ===== 監控指標 (/metrics) =====
+command_seconds = REGISTRY.histogram("bot_command_seconds", "斜線指令處理時間", ["command", "status"])
+message_seconds = REGISTRY.histogram("bot_on_message_seconds", "on_message 處理時間")
+filter_checks = REGISTRY.counter("bot_filter_checks_total", "過濾器檢查次數", ["result"])
+
+def observe_command(interaction, status):
+    started = interaction.extras.get("started_at")
+    if started is None: return
+    name = interaction.command.qualified_name if interaction.command else "unknown"
+    command_seconds.observe(time.perf_counter() - started, name, status)
+
+REGISTRY.callback("bot_gateway_latency_seconds", "Gateway 心跳延遲",
+                  fn=lambda: [] if math.isnan(bot.latency) else [((), bot.latency)])
+REGISTRY.callback("bot_shard_latency_seconds", "各分片的 Gateway 心跳延遲", labels=["shard"],
+                  fn=lambda: [((sid,), lat) for sid, lat in getattr(bot, "latencies", []) if not math.isnan(lat)])
+REGISTRY.callback("bot_startup_seconds", "從程式啟動到各階段的秒數", labels=["phase"],
+                  fn=lambda: [((phase,), sec) for phase, sec in list(startup_marks.items())])
+REGISTRY.callback("bot_guilds", "所在伺服器數量", fn=lambda: [((), len(bot.guilds))])
+REGISTRY.callback("bot_voice_reconnect_attempts_total", "語音重連嘗試次數", "counter", ["guild"],
+                  fn=lambda: [((gid,), s.attempts) for gid, s in list(voice_supervisor.stats.items())])
+REGISTRY.callback("bot_voice_reconnect_failures_total", "語音重連失敗次數", "counter", ["guild"],
+                  fn=lambda: [((gid,), s.failures) for gid, s in list(voice_supervisor.stats.items())])
+REGISTRY.callback("bot_voice_connected", "語音連線狀態", labels=["guild"],
+                  fn=lambda: [((vc.guild.id,), int(vc.is_connected())) for vc in list(bot.voice_clients)])
+REGISTRY.callback("bot_voice_playing", "正在播放的音訊串流", labels=["guild"],
+                  fn=lambda: [((vc.guild.id,), int(vc.is_playing())) for vc in list(bot.voice_clients)])
+REGISTRY.callback("bot_streams_active", "佔用轉碼名額的伺服器數", fn=lambda: [((), len(stream_governor.active))])
+REGISTRY.callback("bot_streams_waiting", "等待轉碼名額的伺服器數", fn=lambda: [((), len(stream_governor.waiting))])
+REGISTRY.callback("bot_ffmpeg_processes", "ffmpeg 子程序數量", fn=lambda: [((), stream_governor.ffmpeg_count)])
+REGISTRY.callback("bot_ffmpeg_cpu_percent", "ffmpeg 子程序合計 CPU 使用率 (佔整台機器)",
+                  fn=lambda: [((), stream_governor.ffmpeg_cpu)])
+REGISTRY.callback("bot_ffmpeg_rss_bytes", "ffmpeg 子程序合計記憶體", fn=lambda: [((), stream_governor.ffmpeg_rss)])
+
+# /系統狀態 的時間序列 (process_* / host_* 由 ResourceSampler 自己讀取)
+resource_sampler = ResourceSampler()
+resource_sampler.add_source("ffmpeg_count", lambda: stream_governor.ffmpeg_count)
+resource_sampler.add_source("ffmpeg_cpu", lambda: stream_governor.ffmpeg_cpu)
+resource_sampler.add_source("ffmpeg_rss", lambda: stream_governor.ffmpeg_rss / 1024 / 1024)
+resource_sampler.add_source("loop_lag", lambda: None if loop_lag.get() is None else loop_lag.get() * 1000)
+resource_sampler.add_source("gateway_latency", lambda: None if math.isnan(bot.latency) else bot.latency * 1000)
+resource_sampler.add_source("voice_connections", lambda: len(bot.voice_clients))
+
+# 過濾器處分 (刪除、禁言、紀錄) 交給背景佇列處理
+moderation = ModerationPipeline(bot)
+
+# 重啟後保留的狀態，寫入由背景執行緒處理
+state_store = StateStore()
+atexit.register(state_store.close)
+
+# 審核日誌由事件寫入本機快取，AUDIT_LOG_PERSIST=1 時同時存進 SQLite
+audit_logs = AuditLogCache(store=state_store if os.environ.get("AUDIT_LOG_PERSIST") else None)
+
+# 不雅語言偵測設定 (每個伺服器各自一份)
+filter_configs = {}
+
+def get_filter_config(guild_id):
+    config = filter_configs.get(guild_id)
+    if config is None:
+        config = filter_configs[guild_id] = {
+            "enabled": False,
+            "log_channel_id": None,
+            "custom": [],   # 伺服器自行新增的詞彙，內建詞庫不存檔
+            "keywords": KeywordMatcher(COMMON_PROFANITY)
+        }
+    return config
+
+def save_filter_config(guild_id):
+    config = filter_configs[guild_id]
+    state_store.set("filter", guild_id, {
+        "enabled": config["enabled"],
+        "log_channel_id": config["log_channel_id"],
+        "custom": config["custom"]
+    })
 
 # ===== 播放音檔設定 =====
-FFMPEG_OPTIONS = {
-    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-    'options': '-vn',
-}
+# ffmpeg 參數與播放引擎 (AUDIO_ENGINE=pcm/opus) 在 audio_engine.py
+audio_cache = AudioCache()
 
 # ===== 審核日誌對照表 =====
 AUDIT_LOG_ACTIONS_CN = {
@@ -104,13 +240,15 @@ AUDIT_LOG_ACTIONS_CN = {
 def get_help_text(bot_mention):
     return (
         f"## {bot_mention} 使用手冊\n"
-        "本機器人為 24/7 語音掛機設計 具備30秒自動重連機制。\n\n"
+        "本機器人為 24/7 語音掛機設計 斷線後會自動重連。\n\n"
         "### 指令列表\n"
         "* /加入 [頻道]：進入語音頻道掛機。\n"
         "* /設定統計頻道：建立自動更新人數的統計頻道。\n"
         "* /播放 [檔案]：上傳音檔（mp3, ogg, m4a）播放。\n"
+        "* /播放網址 [網址或關鍵字]：播放影片、播放清單或搜尋結果。\n"
         "* /系統狀態：查看硬體資訊。\n"
         "* /停止播放：中斷目前的音樂。\n"
+        "* /移除歌曲 [編號] / /跳至 [編號]：管理待播清單。\n"
         "* /離開：退出頻道並停止掛機。\n"
         "* /開始標註 [成員] [內容] [次數]：執行標註轟炸。\n"
         "* /停止標註：結束轟炸。\n"
@@ -118,7 +256,7 @@ def get_help_text(bot_mention):
         "* /新增過濾詞彙：手動加入關鍵字。\n"
         "* /狀態：查看掛機時間與延遲。\n"
         "* /移除身分組 / /給予身分組：管理成員權限。\n"
-        "* /查看審核日誌：查看操作紀錄。\n"
+        "* /查看審核日誌 [執行者] [動作] [小時]：查看與篩選操作紀錄。\n"
         "* /使用方式：顯示本手冊。"
     )
 
@@ -135,54 +273,233 @@ async def tag_logic(channel, target, content, times):
             break
         await asyncio.sleep(0.8)
 
+QUEUE_PAGE_SIZE = 10
+HISTORY_LIMIT = 50
+
 class MusicManager:
     def __init__(self, guild_id):
         self.guild_id = guild_id
-        self.queue = []     
-        self.history = []    
+        self.queue = TrackQueue()
+        self.history = deque(maxlen=HISTORY_LIMIT)  # 只保留最近播放過的歌曲
         self.current = None  
-        self.volume = 0.5    
+        self.volume = DEFAULT_VOLUME
         self.mode = "none"
         self.vc = None
-
-    def get_status_embed(self):
-        status = "播放中" if self.vc and self.vc.is_playing() else "已暫停"
+        self.resolving = False
+        self.skip_requested = False
+        self.channel_id = None
+        self.saved_signature = None
+        self.idle_since = None
+
+    def state_signature(self):
+        """狀態沒變就不用重新存檔"""
+        channel_id = self.vc.channel.id if self.vc and self.vc.channel else self.channel_id
+        return (self.queue.version, id(self.current), self.volume, self.mode, channel_id)
+
+    def snapshot(self):
+        # 目前歌曲放在最前面，還原後從這首開始播
+        tracks = ([self.current] if self.current else []) + list(self.queue)
+        return {
+            "tracks": [t.to_dict() for t in tracks],
+            "volume": self.volume,
+            "mode": self.mode,
+            "channel_id": self.vc.channel.id if self.vc and self.vc.channel else self.channel_id
+        }
+
+    def restore(self, data):
+        self.queue = TrackQueue(Track.from_dict(t) for t in data.get("tracks", []))
+        self.volume = data.get("volume", self.volume)
+        self.mode = data.get("mode", self.mode)
+        self.channel_id = data.get("channel_id")
+        self.saved_signature = self.state_signature()
+
+    def page_count(self):
+        return max((len(self.queue) + QUEUE_PAGE_SIZE - 1) // QUEUE_PAGE_SIZE, 1)
+
+    def get_status_embed(self, page=0):
+        position = stream_governor.position(self.guild_id)
+        if position: status = f"排隊中 (第 {position} 位)"
+        else: status = "播放中" if self.vc and self.vc.is_playing() else "已暫停"
         loop_map = {"none": "不循環", "single": "單曲循環", "all": "歌單循環"}
         embed = discord.Embed(title="音樂控制面板", color=0xaa96da)
-        embed.add_field(name="當前歌曲", value=self.current[1] if self.current else "無", inline=False)
+        embed.add_field(name="當前歌曲", value=self.current.title if self.current else "無", inline=False)
         embed.add_field(name="狀態", value=status, inline=True)
         embed.add_field(name="循環模式", value=loop_map.get(self.mode), inline=True)
         embed.add_field(name="當前音量", value=f"{int(self.volume*100)}%", inline=True)
-        embed.set_footer(text=f"待播清單剩餘: {len(self.queue)} 首歌曲")
+        if position or len(stream_governor.active) >= stream_governor.max_streams:
+            embed.add_field(
+                name="串流名額",
+                value=f"使用中 {len(stream_governor.active)}/{stream_governor.max_streams} | 排隊 {len(stream_governor.waiting)} 個伺服器",
+                inline=False
+            )
+
+        page = min(max(page, 0), self.page_count() - 1)
+        offset = page * QUEUE_PAGE_SIZE
+        lines = []
+        for i, track in enumerate(self.queue.page(offset, QUEUE_PAGE_SIZE), start=offset + 1):
+            line = f"{i}. {track.title} [{format_duration(track.duration)}]"
+            if track.requester: line += f" - {track.requester}"
+            lines.append(line)
+        if lines:
+            embed.add_field(name="待播清單", value="\n".join(lines)[:1024], inline=False)
+        embed.set_footer(text=f"待播清單剩餘: {len(self.queue)} 首歌曲 | 第 {page + 1}/{self.page_count()} 頁")
         return embed
 
     def play_next(self, error=None):
-        if not self.vc or not self.vc.is_connected(): return
+        if not self.vc or not self.vc.is_connected():
+            stream_governor.release(self.guild_id)
+            return
+        skipped, self.skip_requested = self.skip_requested, False
         if self.current:
-            if self.mode == "single": self.queue.insert(0, self.current)
-            elif self.mode == "all": self.queue.append(self.current)
+            if self.mode == "single" and not skipped:
+                # 單曲循環直接重播，不必放回佇列
+                return self._start(self.current)
+            if self.mode == "all": self.queue.append(self.current)
             else: self.history.append(self.current)
         if not self.queue:
             self.current = None
+            stream_governor.release(self.guild_id)
+            return
+        self.current = self.queue.popleft()
+        self._start(self.current)
+
+    def skip(self):
+        """跳過目前歌曲，停止播放後由 after 回呼接著播下一首"""
+        if self.vc and (self.vc.is_playing() or self.vc.is_paused()):
+            self.skip_requested = True
+            self.vc.stop()
+
+    def jump(self, index):
+        """跳到待播清單第 index 首 (從 0 起算)"""
+        if self.mode == "all":
+            # 歌單循環時被跳過的歌曲移到清單最後
+            self.queue.extend(self.queue.page(0, index))
+        self.queue.jump(index)
+        if self.vc and (self.vc.is_playing() or self.vc.is_paused()): self.skip()
+        elif not self.resolving: self.play_next()
+
+    def is_idle(self):
+        # 排隊等名額時也不算閒置，否則加歌會把正在等的歌曲跳過
+        return (not self.vc.is_playing() and not self.vc.is_paused() and not self.resolving
+                and self.guild_id not in stream_governor.waiting)
+
+    def _source_for(self, track, start=0.0, stream_url=None):
+        """建立播放來源，網址歌曲 (cache_key 為 None) 尚未解析時回傳 None"""
+        if track.cache_key is None:
+            if stream_url is None:
+                info = ytdl.cached_track(track.url)
+                if not info: return None
+                stream_url = info['stream_url']
+            return build_source(stream_url, None, self.volume, start)
+        path = audio_cache.get(track.cache_key)
+        if not path:
+            # 邊播邊存，下次循環或重播就直接讀本機檔
+            audio_cache.prefetch(track.url, track.cache_key, track.title, track.size)
+        return build_source(track.url, path, self.volume, start)
+
+    def _start(self, track, stream_url=None):
+        # 名額用完時先排隊，輪到時由 _admitted 接著播目前歌曲
+        if not stream_governor.acquire(self.guild_id, self._admitted): return
+        source = self._source_for(track, stream_url=stream_url)
+        if source is None:
+            # 播放清單中的歌曲在要播放時才解析串流網址
+            self.resolving = True
+            bot.loop.create_task(self._resolve_and_start(track))
             return
-        self.current = self.queue.pop(0)
-        source = discord.PCMVolumeTransformer(
-            discord.FFmpegPCMAudio(self.current[0], **FFMPEG_OPTIONS),
-            volume=self.volume
-        )
         self.vc.play(source, after=lambda e: bot.loop.call_soon_threadsafe(self.play_next, e))
+        self.prefetch_next()
+
+    def _admitted(self):
+        if not self.current or not self.vc or not self.vc.is_connected(): return False
+        if self.vc.is_playing() or self.vc.is_paused(): return False
+        self._start(self.current)
+
+    async def _resolve_and_start(self, track):
+        try:
+            info = await ytdl.resolve_track(track.url)
+            stream_url = info.get('stream_url')
+        except Exception:
+            stream_url = None
+        finally:
+            self.resolving = False
+        if self.current is not track or not self.vc or not self.vc.is_connected(): return
+        if not stream_url:
+            # 解析失敗就跳過這首
+            self.current = None
+            self.play_next()
+        elif not self.vc.is_playing() and not self.vc.is_paused():
+            self._start(track, stream_url)
+
+    def prefetch_next(self):
+        """播放目前歌曲時先下載下一首"""
+        if self.mode == "single" or (not self.queue and self.mode == "all"):
+            nxt = self.current
+        else:
+            nxt = self.queue[0] if self.queue else None
+        if nxt:
+            if nxt.cache_key is None: ytdl.prefetch(nxt.url)
+            else: audio_cache.prefetch(nxt.url, nxt.cache_key, nxt.title, nxt.size)
+
+    def set_volume(self, volume):
+        self.volume = min(max(volume, 0.0), 2.0)
+        if not self.vc or not self.current or not (self.vc.is_playing() or self.vc.is_paused()): return
+        source = self.vc.source
+        if isinstance(source, discord.PCMVolumeTransformer):
+            source.volume = self.volume
+        elif isinstance(source, OpusTrackSource):
+            # Opus 已在 ffmpeg 內編碼，只能從目前位置重新啟動 ffmpeg 套用新音量
+            new_source = self._source_for(self.current, start=source.position)
+            if new_source:
+                self.vc.source = new_source
+                source.cleanup()
 
 class MusicControlView(discord.ui.View):
     def __init__(self, manager):
         super().__init__(timeout=None)
         self.manager = manager
+        self.page = 0
+
+    async def refresh(self, interaction):
+        self.page = min(self.page, self.manager.page_count() - 1)
+        await interaction.response.edit_message(embed=self.manager.get_status_embed(self.page), view=self)
 
     @discord.ui.button(label="暫停/繼續", style=discord.ButtonStyle.primary, row=0)
     async def pause_resume(self, interaction: discord.Interaction, button: discord.ui.Button):
         if not self.manager.vc: return
         if self.manager.vc.is_playing(): self.manager.vc.pause()
         elif self.manager.vc.is_paused(): self.manager.vc.resume()
-        await interaction.response.edit_message(embed=self.manager.get_status_embed(), view=self)
+        await self.refresh(interaction)
+
+    @discord.ui.button(label="跳過", style=discord.ButtonStyle.primary, row=0)
+    async def skip(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.manager.skip()
+        await self.refresh(interaction)
+
+    @discord.ui.button(label="音量-", style=discord.ButtonStyle.secondary, row=0)
+    async def volume_down(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.manager.set_volume(round(self.manager.volume - 0.1, 2))
+        await self.refresh(interaction)
+
+    @discord.ui.button(label="音量+", style=discord.ButtonStyle.secondary, row=0)
+    async def volume_up(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.manager.set_volume(round(self.manager.volume + 0.1, 2))
+        await self.refresh(interaction)
+
+    @discord.ui.button(label="上一頁", style=discord.ButtonStyle.secondary, row=1)
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(self.page - 1, 0)
+        await self.refresh(interaction)
+
+    @discord.ui.button(label="下一頁", style=discord.ButtonStyle.secondary, row=1)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await self.refresh(interaction)
+
+    @discord.ui.button(label="隨機排序", style=discord.ButtonStyle.secondary, row=1)
+    async def shuffle(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.manager.queue.shuffle()
+        self.manager.prefetch_next()
+        await self.refresh(interaction)
 
 # =========================================================
 # ===== 事件監聽 (過濾器與標註手冊) =====
@@ -190,41 +507,164 @@ class MusicControlView(discord.ui.View):
 @bot.event
 async def on_message(message):
     if message.author.bot: return
+    started = time.perf_counter()
 
     if bot.user.mentioned_in(message) and message.mention_everyone is False:
         await message.channel.send(get_help_text(bot.user.mention))
 
-    if filter_config["enabled"]:
-        if any(word in message.content for word in filter_config["keywords"]):
-            try:
-                msg_text = message.content
-                user = message.author
-                await message.delete()
-                await user.timeout(datetime.timedelta(seconds=60), reason="使用不雅詞彙")
-                
-                if filter_config["log_channel_id"]:
-                    log_ch = bot.get_channel(filter_config["log_channel_id"])
-                    if log_ch:
-                        log_embed = discord.Embed(title="違規紀錄", color=0xff0000)
-                        log_embed.add_field(name="用戶", value=user.mention)
-                        log_embed.add_field(name="違規內容", value=msg_text)
-                        await log_ch.send(embed=log_embed)
-            except: pass
+    config = filter_configs.get(message.guild.id) if message.guild else None
+    if config and config["enabled"]:
+        hit_word = config["keywords"].search(message.content)
+        filter_checks.inc("hit" if hit_word else "miss")
+        if hit_word:
+            moderation.submit(message, hit_word, config["log_channel_id"])
 
+    message_seconds.observe(time.perf_counter() - started)
     await bot.process_commands(message)
 
 @bot.event
-async def on_ready():
+async def on_app_command_completion(interaction, command):
+    observe_command(interaction, "ok")
+
+@bot.event
+async def on_voice_state_update(member, before, after):
+    await voice_supervisor.on_voice_state_update(member, before, after)
+
+# ===== 指令同步 =====
+def command_tree_hash():
+    """將指令樹序列化後計算雜湊，內容沒變就不用重新同步"""
+    payload = []
+    for cmd in tree.get_commands():
+        try: payload.append(cmd.to_dict(tree))
+        except TypeError: payload.append(cmd.to_dict())
+    raw = json.dumps([bot.application_id, sorted(payload, key=lambda d: d["name"])], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+async def sync_commands():
+    # 多程序分片模式下指令是全域的，只由 0 號工作程序同步
+    if not IS_PRIMARY: return False
+    digest = command_tree_hash()
+    if not os.environ.get("FORCE_COMMAND_SYNC") and state_store.load("meta").get("command_hash") == digest:
+        return False
     await tree.sync()
+    state_store.set("meta", "command_hash", digest)
+    return True
+
+@bot.event
+async def on_ready():
+    # gateway 重連也會觸發 on_ready，初始化只做一次
+    if health["ready_once"]: return
+    mark_startup("ready")
+    synced = await sync_commands()
+    mark_startup("command_sync")
+
+    rename_scheduler.start()
+    moderation.start()
+    stream_governor.start()
+    disconnect_idle_players.start()
     update_member_stats.start()
     check_connection.start()
-
-    await bot.change_presence(
-        status=discord.Status.online,
-        activity=discord.Game(name="24/7 掛機中")
-    )
+    save_music_state.start()
+    bot.loop.create_task(restore_voice_sessions())
+    # 在背景先準備好 ffmpeg，第一次播放時就不必等待
+    bot.loop.run_in_executor(None, ensure_ffmpeg)
+    health["ready_once"] = True
 
     print(f"機器人已啟動：{bot.user}")
+    print(f"{startup_report()} | 指令同步: {'已更新' if synced else '未變更，略過'}")
+    if SHARDED: print(f"工作程序 {CLUSTER_ID} | 分片 {sorted(bot.shards)} / 共 {bot.shard_count} 個")
+
+# =========================================================
+# ===== 健康檢查 (/healthz /readyz) =====
+# =========================================================
+# gateway 斷線超過這個秒數仍未恢復，視為卡住需要重啟
+LIVENESS_GRACE = int(os.environ.get("LIVENESS_GRACE", 300))
+# 語音重連連續失敗超過這個次數，視為未就緒
+VOICE_READY_MAX_FAILURES = 5
+
+health = {"ready_once": False, "disconnected_since": None, "shards_down": {}}
+
+@bot.event
+async def on_disconnect():
+    if health["disconnected_since"] is None:
+        health["disconnected_since"] = time.time()
+
+@bot.event
+async def on_connect():
+    mark_startup("gateway_connected")
+    health["disconnected_since"] = None
+
+@bot.event
+async def on_resumed():
+    health["disconnected_since"] = None
+
+# 分片模式下每個分片各自斷線重連，某個分片的 on_connect 不代表其他分片已恢復
+@bot.event
+async def on_shard_disconnect(shard_id):
+    health["shards_down"].setdefault(shard_id, time.time())
+
+@bot.event
+async def on_shard_connect(shard_id):
+    health["shards_down"].pop(shard_id, None)
+
+@bot.event
+async def on_shard_resumed(shard_id):
+    health["shards_down"].pop(shard_id, None)
+
+def gateway_down_since():
+    """最早斷線且尚未恢復的時間，全部正常回傳 None"""
+    times = [t for t in [health["disconnected_since"], *health["shards_down"].values()] if t]
+    return min(times) if times else None
+
+def check_liveness():
+    since = gateway_down_since()
+    down_for = time.time() - since if since else 0
+    return down_for < LIVENESS_GRACE, {"gateway_down_seconds": round(down_for, 1)}
+
+def check_readiness():
+    gateway_ok = not bot.is_closed() and bot.is_ready() and gateway_down_since() is None
+    voice_total = len(stay_channels)
+    voice_connected = 0
+    voice_failing = []
+    for gid in list(stay_channels):
+        guild = bot.get_guild(gid)
+        if guild and guild.voice_client and guild.voice_client.is_connected():
+            voice_connected += 1
+            continue
+        stats = voice_supervisor.stats.get(gid)
+        if stats and stats.consecutive_failures >= VOICE_READY_MAX_FAILURES:
+            voice_failing.append(str(gid))
+    ok = gateway_ok and health["ready_once"] and not voice_failing
+    return ok, {
+        "gateway": gateway_ok,
+        "on_ready": health["ready_once"],
+        "latency_ms": None if math.isnan(bot.latency) else round(bot.latency * 1000),
+        "voice": {"expected": voice_total, "connected": voice_connected, "failing": voice_failing},
+        "cluster": CLUSTER_ID,
+        "shards": sorted(bot.shards) if SHARDED else None,
+        "shards_down": sorted(health["shards_down"]),
+    }
+
+health_server = HealthServer(check_liveness, check_readiness)
+
+async def setup_hook():
+    # 在連線 gateway 之前就開始回應健康檢查
+    await health_server.start()
+    mark_startup("health_server")
+    bot.loop.create_task(monitor_loop_lag())
+    resource_sampler.start()
+
+bot.setup_hook = setup_hook
+
+# 關閉 bot 後一併結束音檔快取的下載與 HTTP 連線，以及 yt-dlp 子行程
+_close_bot = bot.close
+
+async def close_bot():
+    await _close_bot()
+    await audio_cache.close()
+    ytdl.shutdown()
+
+bot.close = close_bot
 
 
 # =========================================================
@@ -311,8 +751,10 @@ async def show_help(interaction: discord.Interaction):
 @app_commands.describe(開啟="是否啟動", 記錄頻道="違規訊息日誌頻道")
 @app_commands.checks.has_permissions(manage_guild=True)
 async def filter_set(interaction: discord.Interaction, 開啟: bool, 記錄頻道: discord.TextChannel):
-    filter_config["enabled"] = 開啟
-    filter_config["log_channel_id"] = 記錄頻道.id
+    config = get_filter_config(interaction.guild_id)
+    config["enabled"] = 開啟
+    config["log_channel_id"] = 記錄頻道.id
+    save_filter_config(interaction.guild_id)
     status = "開啟" if 開啟 else "關閉"
     await interaction.response.send_message(f"過濾系統：{status}，日誌頻道：{記錄頻道.mention}")
 
@@ -320,8 +762,10 @@ async def filter_set(interaction: discord.Interaction, 開啟: bool, 記錄頻
 @app_commands.describe(詞彙="要禁用的字詞")
 @app_commands.checks.has_permissions(manage_guild=True)
 async def add_profanity(interaction: discord.Interaction, 詞彙: str):
-    if 詞彙 not in filter_config["keywords"]:
-        filter_config["keywords"].append(詞彙)
+    config = get_filter_config(interaction.guild_id)
+    if config["keywords"].add(詞彙):
+        config["custom"].append(詞彙)
+        save_filter_config(interaction.guild_id)
         await interaction.response.send_message(f"已將「{詞彙}」加入過濾名單")
     else:
         await interaction.response.send_message("該詞彙已在名單中")
@@ -346,6 +790,7 @@ async def join_vc(interaction: discord.Interaction, 頻道: discord.VoiceChannel
     await 頻道.connect(self_deaf=True)
     stay_channels[interaction.guild.id] = 頻道.id
     stay_since[interaction.guild.id] = time.time()
+    state_store.set("stay", interaction.guild.id, {"channel_id": 頻道.id, "since": stay_since[interaction.guild.id]})
     await interaction.response.send_message(f"我進來 {頻道.name} 竊聽了")
 
 @tree.command(name="播放", description="播放上傳的音檔")
@@ -354,18 +799,80 @@ async def play_audio(interaction: discord.Interaction, 檔案: discord.Attachmen
         return await interaction.response.send_message("格式不支援", ephemeral=True)
     
     await interaction.response.defer(thinking=True)
+    mgr = await get_music_manager(interaction)
+    if not mgr: return
+
+    mgr.queue.append(Track(
+        檔案.url, 檔案.filename, duration=getattr(檔案, "duration", None), requester=interaction.user.display_name,
+        cache_key=AudioCache.make_key(檔案.id, 檔案.size), size=檔案.size
+    ))
+    if mgr.is_idle(): mgr.play_next()
+    else: mgr.prefetch_next()
+    await interaction.followup.send(embed=mgr.get_status_embed(), view=MusicControlView(mgr))
+
+@tree.command(name="播放網址", description="播放網址或搜尋關鍵字 (支援播放清單)")
+@app_commands.describe(網址="影片或播放清單網址，也可以直接輸入關鍵字搜尋")
+async def play_url(interaction: discord.Interaction, 網址: str):
+    await interaction.response.defer(thinking=True)
+    mgr = await get_music_manager(interaction)
+    if not mgr: return
+
+    try:
+        info = await ytdl.resolve(網址)
+    except Exception as e:
+        return await interaction.followup.send(f"解析失敗: {e}")
+
+    if info["type"] == "playlist":
+        # 只加入網址與標題，串流網址等到要播放時才解析
+        requester = interaction.user.display_name
+        mgr.queue.extend(
+            Track(entry["webpage_url"], entry["title"], entry["duration"], requester)
+            for entry in info["entries"]
+        )
+        text = f"已加入播放清單「{info['title']}」共 {len(info['entries'])} 首"
+    else:
+        mgr.queue.append(Track(info["webpage_url"], info["title"], info["duration"], interaction.user.display_name))
+        text = f"已加入「{info['title']}」"
+
+    if mgr.is_idle(): mgr.play_next()
+    else: mgr.prefetch_next()
+    await interaction.followup.send(text, embed=mgr.get_status_embed(), view=MusicControlView(mgr))
+
+@tree.command(name="移除歌曲", description="從待播清單移除一首歌")
+@app_commands.describe(編號="待播清單中的編號")
+async def queue_remove(interaction: discord.Interaction, 編號: int):
+    mgr = queues.get(interaction.guild_id)
+    if not mgr or not 1 <= 編號 <= len(mgr.queue):
+        return await interaction.response.send_message("編號不存在", ephemeral=True)
+    track = mgr.queue.remove_at(編號 - 1)
+    if 編號 == 1: mgr.prefetch_next()
+    await interaction.response.send_message(f"已移除「{track.title}」")
+
+@tree.command(name="跳至", description="直接播放待播清單中的指定歌曲")
+@app_commands.describe(編號="待播清單中的編號")
+async def queue_jump(interaction: discord.Interaction, 編號: int):
+    mgr = queues.get(interaction.guild_id)
+    if not mgr or not mgr.vc or not 1 <= 編號 <= len(mgr.queue):
+        return await interaction.response.send_message("編號不存在", ephemeral=True)
+    title = mgr.queue[編號 - 1].title
+    mgr.jump(編號 - 1)
+    await interaction.response.send_message(f"跳至「{title}」")
+
+async def get_music_manager(interaction):
+    """取得伺服器的 MusicManager 並確保已連上語音，失敗時回覆訊息並回傳 None"""
+    # build_source 在事件迴圈上同步執行，ffmpeg 必須先在執行緒中準備好
+    await prepare_ffmpeg()
     gid = interaction.guild_id
     if gid not in queues: queues[gid] = MusicManager(gid)
     mgr = queues[gid]
-    
+
     if not interaction.guild.voice_client:
-        if not interaction.user.voice: return await interaction.followup.send("請先進入語音")
+        if not interaction.user.voice:
+            await interaction.followup.send("請先進入語音")
+            return None
         mgr.vc = await interaction.user.voice.channel.connect(self_deaf=True)
     else: mgr.vc = interaction.guild.voice_client
-
-    mgr.queue.append((檔案.url, 檔案.filename))
-    if not mgr.vc.is_playing() and not mgr.vc.is_paused(): mgr.play_next()
-    await interaction.followup.send(embed=mgr.get_status_embed(), view=MusicControlView(mgr))
+    return mgr
 
 @tree.command(name="設定統計頻道", description="建立人數統計頻道")
 @app_commands.checks.has_permissions(manage_channels=True)
@@ -378,10 +885,8 @@ async def stats_setup(interaction: discord.Interaction):
     
     category = await guild.create_category("伺服器數據", position=0, overwrites=overwrites)
     
-    total = guild.member_count
-    bots = len([m for m in guild.members if m.bot])
-    humans = total - bots
-    online = len([m for m in guild.members if m.status != discord.Status.offline])
+    counter = await load_member_counter(guild)
+    total, humans, online, bots = counter.total, counter.humans, counter.online, counter.bots
     
     c_total = await guild.create_voice_channel(f"全部人數: {total}", category=category, overwrites=overwrites)
     c_humans = await guild.create_voice_channel(f"成員人數: {humans}", category=category, overwrites=overwrites)
@@ -394,6 +899,7 @@ async def stats_setup(interaction: discord.Interaction):
         "online": c_online.id,
         "bots": c_bots.id
     }
+    state_store.set("stats", guild.id, stats_channels[guild.id])
     await interaction.response.send_message("統計頻道建立完成")
 
 @tree.command(name="給予身分組", description="賦予成員身分組")
@@ -414,15 +920,46 @@ async def role_rem(interaction: discord.Interaction, 成員: discord.Member, 身
     except Exception as e:
         await interaction.response.send_message(f"失敗: {e}")
 
+# (項目名稱, 顯示名稱, 單位)
+SYSTEM_SERIES = [
+    ("process_cpu", "Bot CPU", "%"),
+    ("process_rss", "Bot 記憶體", " MB"),
+    ("ffmpeg_count", "ffmpeg 程序數", ""),
+    ("ffmpeg_cpu", "ffmpeg CPU", "%"),
+    ("ffmpeg_rss", "ffmpeg 記憶體", " MB"),
+    ("loop_lag", "事件迴圈延遲", " ms"),
+    ("gateway_latency", "Gateway 延遲", " ms"),
+    ("voice_connections", "語音連線數", ""),
+    ("host_cpu", "主機 CPU", "%"),
+    ("host_memory", "主機記憶體", "%"),
+]
+
 @tree.command(name="系統狀態", description="硬體監控")
 async def sys_info(interaction: discord.Interaction):
-    await interaction.response.send_message(f"CPU: {psutil.cpu_percent()}% | RAM: {psutil.virtual_memory().percent}%")
+    # 數值由背景取樣，這裡只讀環狀緩衝區，不會卡住事件迴圈
+    embed = discord.Embed(title="系統狀態", color=0x2b2d31)
+    for name, label, unit in SYSTEM_SERIES:
+        summary = resource_sampler.summary(name)
+        if summary is None:
+            embed.add_field(name=label, value="尚無資料", inline=True)
+            continue
+        current, p50, p95, peak = summary
+        embed.add_field(
+            name=label,
+            value=f"目前 {current:.1f}{unit}\np50 {p50:.1f} | p95 {p95:.1f} | 最大 {peak:.1f}",
+            inline=True
+        )
+    embed.set_footer(text=f"每 {resource_sampler.interval:g} 秒取樣一次，統計最近 {resource_sampler.window // 60} 分鐘 (CPU 以整台主機為 100%)")
+    await interaction.response.send_message(embed=embed)
 
 @tree.command(name="離開", description="退出語音")
 async def leave_vc(interaction: discord.Interaction):
     if interaction.guild.voice_client:
-        await interaction.guild.voice_client.disconnect()
+        # 先移除掛機設定，避免斷線事件觸發自動重連
         stay_channels.pop(interaction.guild.id, None)
+        state_store.delete("stay", interaction.guild.id)
+        voice_supervisor.cancel(interaction.guild.id)
+        await interaction.guild.voice_client.disconnect()
         await interaction.response.send_message("我走了")
     else: await interaction.response.send_message("沒在任何語音頻道裡我是要離開去哪")
 
@@ -430,41 +967,95 @@ async def leave_vc(interaction: discord.Interaction):
 async def status_info(interaction: discord.Interaction):
     if interaction.guild_id not in stay_channels: return await interaction.response.send_message("未在掛機狀態", ephemeral=True)
     uptime = int(time.time() - stay_since.get(interaction.guild_id, time.time()))
-    await interaction.response.send_message(f"掛機時間: {uptime} 秒 | 延遲: {round(bot.latency * 1000)} ms")
+    text = f"掛機時間: {uptime} 秒 | 延遲: {round(bot.latency * 1000)} ms"
+    stats = voice_supervisor.stats.get(interaction.guild_id)
+    if stats:
+        text += f"\n重連: {stats.successes} 次成功 / {stats.failures} 次失敗"
+        if stats.next_attempt:
+            text += f" | 下次重試: {max(int(stats.next_attempt - time.time()), 0)} 秒後"
+        if stats.last_error:
+            text += f"\n最後錯誤: {stats.last_error}"
+    await interaction.response.send_message(text)
+
+AUDIT_PAGE_SIZE = 10
+
+class AuditLogView(discord.ui.View):
+    def __init__(self, entries, title, owner_id):
+        super().__init__(timeout=300)
+        self.entries = entries
+        self.title = title
+        self.owner_id = owner_id
+        self.page = 0
+
+    async def interaction_check(self, interaction):
+        # 查詢結果只給執行指令的人翻頁
+        if interaction.user.id == self.owner_id: return True
+        await interaction.response.send_message("只有執行指令的人可以翻頁", ephemeral=True)
+        return False
+
+    def page_count(self):
+        return max((len(self.entries) + AUDIT_PAGE_SIZE - 1) // AUDIT_PAGE_SIZE, 1)
+
+    def render(self):
+        start = self.page * AUDIT_PAGE_SIZE
+        lines = [f"### {self.title} (第 {self.page + 1}/{self.page_count()} 頁，共 {len(self.entries)} 筆)"]
+        for entry in self.entries[start:start + AUDIT_PAGE_SIZE]:
+            created = datetime.datetime.fromtimestamp(entry.created_at, datetime.timezone.utc)
+            action_cn = AUDIT_LOG_ACTIONS_CN.get(entry.action, entry.action)
+            lines.append(f"* 時間: {created.strftime('%Y-%m-%d %H:%M:%S')} | 執行者: {entry.user or entry.user_id} | 動作: {action_cn} | 目標: {entry.target}")
+        if not self.entries: lines.append("沒有符合條件的紀錄")
+        return "\n".join(lines)
+
+    @discord.ui.button(label="上一頁", style=discord.ButtonStyle.secondary)
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(self.page - 1, 0)
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+    @discord.ui.button(label="下一頁", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = min(self.page + 1, self.page_count() - 1)
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+@bot.event
+async def on_audit_log_entry_create(entry):
+    audit_logs.add(entry.guild.id, AuditEntry.from_discord(entry))
 
 @tree.command(name="查看審核日誌", description="查看操作紀錄")
-@app_commands.describe(筆數="顯示數量(1-20)")
+@app_commands.describe(筆數="最多顯示數量(1-1000)", 執行者="只顯示此成員的操作", 動作="只顯示此類型的操作", 小時="只顯示最近幾小時內的紀錄")
+@app_commands.choices(動作=[app_commands.Choice(name=cn, value=key) for key, cn in AUDIT_LOG_ACTIONS_CN.items()])
 @app_commands.checks.has_permissions(view_audit_log=True)
-async def show_logs(interaction: discord.Interaction, 筆數: int = 5):
+async def show_logs(interaction: discord.Interaction, 筆數: int = 100, 執行者: discord.Member = None,
+                    動作: app_commands.Choice[str] = None, 小時: int = None):
+    if 筆數 <= 0: return await interaction.response.send_message("筆數必須大於0", ephemeral=True)
+    if 小時 is not None and 小時 <= 0: return await interaction.response.send_message("小時必須大於0", ephemeral=True)
     await interaction.response.defer(thinking=True)
-    筆數 = min(max(筆數, 1), 20)
-    log_text = f"### 最近的 {筆數} 筆審核日誌\n"
-    async for entry in interaction.guild.audit_logs(limit=筆數):
-        raw_action = str(entry.action).split('.')[-1]
-        action_cn = AUDIT_LOG_ACTIONS_CN.get(raw_action, raw_action)
-        log_text += f"* 時間: {entry.created_at.strftime('%Y-%m-%d %H:%M:%S')} | 執行者: {entry.user} | 動作: {action_cn} | 目標: {entry.target}\n"
-    await interaction.followup.send(log_text)
+    筆數 = min(筆數, AUDIT_LOG_LIMIT)
+    # 每個程序只有第一次查詢時向 API 補資料 (包含離線期間的紀錄)，之後都由本機快取回應
+    await audit_logs.backfill(interaction.guild)
+    entries = audit_logs.guild(interaction.guild_id).query(
+        user_id=執行者.id if 執行者 else None,
+        action=動作.value if 動作 else None,
+        since=time.time() - 小時 * 3600 if 小時 else None,
+        limit=筆數
+    )
+    view = AuditLogView(entries, "審核日誌", interaction.user.id)
+    await interaction.followup.send(view.render(), view=view)
 
 # ===== 背景任務 =====
 @tasks.loop(seconds=30)
 async def check_connection():
-    for gid, cid in list(stay_channels.items()):
-        guild = bot.get_guild(gid)
-        if not guild or (guild.voice_client and guild.voice_client.is_connected()): continue
-        ch = bot.get_channel(cid)
-        if ch: 
-            try: await ch.connect(self_deaf=True)
-            except: pass
+    # 斷線事件會立即觸發重連，這裡只是保險的定期檢查
+    voice_supervisor.check_all()
 
-@tasks.loop(minutes=10)
+# 改名由 rename_scheduler 控制額度，所以可以比 Discord 的改名限制更頻繁地計算
+@tasks.loop(minutes=5)
 async def update_member_stats():
     for guild in bot.guilds:
         if guild.id in stats_channels:
             stats = stats_channels[guild.id]
-            total = guild.member_count
-            bots = len([m for m in guild.members if m.bot])
-            humans = total - bots
-            online = len([m for m in guild.members if m.status != discord.Status.offline])
+            try: counter = await load_member_counter(guild)
+            except (discord.HTTPException, discord.RateLimited): continue
+            total, humans, online, bots = counter.total, counter.humans, counter.online, counter.bots
             
             data_map = {
                 "total": f"全部人數: {total}",
@@ -475,13 +1066,88 @@ async def update_member_stats():
             
             for key, name in data_map.items():
                 ch = bot.get_channel(stats.get(key))
-                if ch:
-                    try: await ch.edit(name=name)
-                    except: pass
-                        
-
-token = os.environ.get("DISCORD_TOKEN")
-if token: bot.run(token)
+                if ch: rename_scheduler.submit(ch, name)
+
+@tasks.loop(seconds=60)
+async def disconnect_idle_players():
+    """待播清單播完且沒有新歌超過 IDLE_DISCONNECT 秒就離開語音 (掛機中的伺服器除外)"""
+    now = time.time()
+    for gid, mgr in list(queues.items()):
+        vc = mgr.vc
+        connected = vc is not None and vc.is_connected()
+        # 保險：沒在播放卻還佔著名額就歸還
+        if (not connected or mgr.is_idle()) and gid not in stream_governor.waiting:
+            stream_governor.release(gid)
+        if not connected or gid in stay_channels or not mgr.is_idle() or mgr.current or mgr.queue:
+            mgr.idle_since = None
+            continue
+        if mgr.idle_since is None:
+            mgr.idle_since = now
+            continue
+        if now - mgr.idle_since < IDLE_DISCONNECT: continue
+        queues.pop(gid, None)
+        try: await vc.disconnect()
+        except Exception: pass
+
+@tasks.loop(seconds=15)
+async def save_music_state():
+    for gid, mgr in list(queues.items()):
+        signature = mgr.state_signature()
+        if signature == mgr.saved_signature: continue
+        mgr.saved_signature = signature
+        if mgr.current or mgr.queue: state_store.set("queue", gid, mgr.snapshot())
+        else: state_store.delete("queue", gid)
+
+# ===== 重啟還原 =====
+def load_state():
+    """
+    啟動時從資料庫讀回上次的狀態，只在連線前執行一次
+    多程序分片模式下所有程序共用同一個資料庫，各自只載入自己分片的伺服器
+    """
+    for gid, data in state_store.load("stay").items():
+        if not owns_guild(gid): continue
+        stay_channels[gid] = data["channel_id"]
+        stay_since[gid] = data["since"]
+    stats_channels.update((gid, data) for gid, data in state_store.load("stats").items() if owns_guild(gid))
+    for gid, data in state_store.load("filter").items():
+        if not owns_guild(gid): continue
+        config = get_filter_config(gid)
+        config["enabled"] = data["enabled"]
+        config["log_channel_id"] = data["log_channel_id"]
+        for word in data["custom"]:
+            if config["keywords"].add(word): config["custom"].append(word)
+    for gid, data in state_store.load("queue").items():
+        if not owns_guild(gid): continue
+        mgr = queues[gid] = MusicManager(gid)
+        mgr.restore(data)
+    audit_logs.load(owns_guild)
+
+async def restore_guild_voice(gid):
+    guild = bot.get_guild(gid)
+    if not guild: return
+    mgr = queues.get(gid)
+    if gid in stay_channels:
+        await voice_supervisor.schedule(gid)
+    elif mgr and mgr.channel_id and not guild.voice_client:
+        ch = bot.get_channel(mgr.channel_id)
+        if not ch: return
+        await ch.connect(self_deaf=True)
+    # 語音連上後接著播上次的待播清單
+    if mgr and mgr.queue and guild.voice_client:
+        await prepare_ffmpeg()
+        mgr.vc = guild.voice_client
+        if mgr.is_idle(): mgr.play_next()
+
+async def restore_voice_sessions():
+    """各伺服器同時重新連線，由 voice_supervisor 限制同時握手數量"""
+    gids = set(stay_channels) | {gid for gid, mgr in queues.items() if mgr.queue}
+    await asyncio.gather(*(restore_guild_voice(gid) for gid in gids), return_exceptions=True)
+
+load_state()
+
+if __name__ == "__main__":
+    token = os.environ.get("DISCORD_TOKEN")
+    if token: bot.run(token)
 
 
 
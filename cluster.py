@@ -0,0 +1,255 @@
+"""
+多程序分片模式的主程序
+把分片切成幾段，每段啟動一個 bot.py 工作程序 (AutoShardedBot)，並把健康檢查與指標彙整到 PORT
+
+    python cluster.py
+
+環境變數
+    DISCORD_TOKEN    ：同 bot.py
+    CLUSTER_WORKERS  ：工作程序數量，預設為 CPU 核心數 (不會超過分片數)
+    SHARD_COUNT      ：總分片數，未設定時向 Discord 取得建議值
+    WORKER_PORT_BASE ：工作程序健康檢查的起始連接埠，預設 PORT + 1，只監聽 127.0.0.1
+
+各工作程序之間的資源
+    共用：STATE_DB_PATH 的 SQLite 狀態資料庫 (WAL 模式)，各程序只載入自己分片的伺服器
+    各自一份：
+        AUDIO_CACHE_DIR    每個程序使用 <AUDIO_CACHE_DIR>/<工作程序編號> 子目錄，
+                           AUDIO_CACHE_MAX_MB 平均分給各程序，總用量不超過原本的上限
+        MAX_STREAMS 等串流限制 (stream_governor.py) 是每個程序各自計算，
+                           整台機器最多 工作程序數 x MAX_STREAMS 個 ffmpeg
+"""
+import asyncio
+import os
+import signal
+import sys
+import time
+
+import aiohttp
+
+from metrics import REGISTRY
+from server import PORT, HealthServer
+from sharding import split_shards
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+AUDIO_CACHE_DIR = os.environ.get("AUDIO_CACHE_DIR", "audio_cache")
+AUDIO_CACHE_MAX_MB = int(os.environ.get("AUDIO_CACHE_MAX_MB", 512))
+WORKER_PORT_BASE = int(os.environ.get("WORKER_PORT_BASE", PORT + 1))
+# 同一個 bot 同時只能有一個分片在 IDENTIFY (每 5 秒一次)，工作程序依分片數錯開啟動
+IDENTIFY_INTERVAL = 5.5
+POLL_INTERVAL = 5.0
+# 工作程序啟動後超過這個秒數仍無法通過 /healthz 就強制重啟
+STARTUP_GRACE = 120.0
+RESTART_MAX_DELAY = 60.0
+
+# 主程序自己的指標用 worker 標籤，cluster 標籤留給合併時標示來源
+worker_restarts = REGISTRY.counter("cluster_worker_restarts_total", "工作程序重啟次數", ["worker"])
+
+async def recommended_shards(token):
+    """向 Discord 取得建議的分片數"""
+    async with aiohttp.ClientSession() as session:
+        async with session.get("https://discord.com/api/v10/gateway/bot",
+                               headers={"Authorization": f"Bot {token}"}) as resp:
+            resp.raise_for_status()
+            return (await resp.json())["shards"]
+
+def _add_label(line, label):
+    """在 Prometheus 樣本行加上 cluster 標籤，已有同名標籤的樣本維持原樣 (重複的標籤名稱會讓整份抓取失敗)"""
+    name, _, value = line.rpartition(" ")
+    if not name.endswith("}"): return f"{name}{{{label}}} {value}"
+    key = label.split("=", 1)[0]
+    labels = name[name.index("{") + 1:-1]
+    if f",{key}=" in f",{labels}": return line
+    return f"{name[:-1]},{label}}} {value}"
+
+def merge_metrics(sources):
+    """
+    合併多份 Prometheus 文字格式，sources 為 [(cluster 名稱, 文字), ...]
+    同名指標的 HELP / TYPE 只輸出一次，每筆樣本加上 cluster 標籤
+    """
+    families = {}   # 指標名稱 -> [HELP, TYPE, 樣本...]
+    for cluster, text in sources:
+        label = f'cluster="{cluster}"'
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# HELP ") or line.startswith("# TYPE "):
+                family = line.split(" ", 3)[2]
+                lines = families.setdefault(family, [None, None])
+                slot = 0 if line.startswith("# HELP ") else 1
+                if lines[slot] is None: lines[slot] = line
+            elif line and family is not None:
+                families[family].append(_add_label(line, label))
+    out = []
+    for lines in families.values():
+        out.extend(line for line in lines if line)
+    return "\n".join(out) + "\n"
+
+class Worker:
+    def __init__(self, cluster_id, shard_ids, shard_count, port, cache_mb):
+        self.cluster_id = cluster_id
+        self.cache_mb = cache_mb
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.port = port
+        self.proc = None
+        self.restarts = 0
+        self.started_at = None
+        self.live = False
+        self.ready = False
+        self.details = {}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def running(self):
+        return self.proc is not None and self.proc.returncode is None
+
+    async def spawn(self):
+        env = dict(os.environ,
+                   SHARD_COUNT=str(self.shard_count),
+                   SHARD_IDS=",".join(map(str, self.shard_ids)),
+                   CLUSTER_ID=str(self.cluster_id),
+                   PORT=str(self.port),
+                   HEALTH_HOST="127.0.0.1",
+                   # 音檔快取各用一個目錄，避免啟動時互刪下載中的 .part 檔或互相淘汰
+                   AUDIO_CACHE_DIR=os.path.join(AUDIO_CACHE_DIR, str(self.cluster_id)),
+                   AUDIO_CACHE_MAX_MB=str(self.cache_mb))
+        self.proc = await asyncio.create_subprocess_exec(sys.executable, BOT_SCRIPT, env=env)
+        self.started_at = time.time()
+        self.live = self.ready = False
+        print(f"[cluster] 工作程序 {self.cluster_id} 啟動 (pid {self.proc.pid}) 分片 {self.shard_ids[0]}-{self.shard_ids[-1]}")
+
+class ClusterSupervisor:
+    """
+    啟動並看管各工作程序
+    * 程序結束時以指數退避重啟，/healthz 失敗 (卡住) 的程序直接結束後重啟，不必重啟整個容器
+    * 定期輪詢各程序的 /healthz /readyz，主程序的健康檢查直接讀結果，不在請求時才去問
+    * /metrics 抓取時同時向各程序取得指標並加上 cluster 標籤
+    """
+
+    def __init__(self, shard_count, workers):
+        ranges = split_shards(shard_count, workers)
+        cache_mb = max(AUDIO_CACHE_MAX_MB // len(ranges), 1)
+        self.workers = [
+            Worker(i, ids, shard_count, WORKER_PORT_BASE + i, cache_mb)
+            for i, ids in enumerate(ranges)
+        ]
+        self.server = HealthServer(self.liveness, self.readiness, render=self.render_metrics)
+        self.session = None
+        self._stopping = False
+        self.stopped = asyncio.Event()
+
+    async def run(self):
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=3))
+        REGISTRY.callback("cluster_worker_up", "工作程序是否存活", labels=["worker"],
+                          fn=lambda: [((w.cluster_id,), int(w.running() and w.live)) for w in self.workers])
+        await self.server.start()
+        tasks = [asyncio.create_task(self._poll_loop())]
+        delay = 0.0
+        for worker in self.workers:
+            tasks.append(asyncio.create_task(self._keep_alive(worker, delay)))
+            delay += len(worker.shard_ids) * IDENTIFY_INTERVAL
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            await self.session.close()
+
+    async def _keep_alive(self, worker, delay):
+        await asyncio.sleep(delay)
+        failures = 0
+        while not self._stopping:
+            await worker.spawn()
+            code = await worker.proc.wait()
+            if self._stopping: return
+            # 跑超過 10 分鐘才結束就當作偶發錯誤，重新計算退避
+            failures = 1 if time.time() - worker.started_at > 600 else failures + 1
+            worker.restarts += 1
+            worker_restarts.inc(worker.cluster_id)
+            wait = min(2 ** failures, RESTART_MAX_DELAY)
+            print(f"[cluster] 工作程序 {worker.cluster_id} 結束 (代碼 {code})，{wait:.0f} 秒後重啟")
+            await asyncio.sleep(wait)
+
+    async def _poll(self, worker):
+        if not worker.running():
+            worker.live = worker.ready = False
+            return
+        for path in ("healthz", "readyz"):
+            try:
+                async with self.session.get(f"{worker.url}/{path}") as resp:
+                    ok = resp.status == 200
+                    if path == "readyz": worker.details = await resp.json()
+            except Exception:
+                ok = False
+            if path == "healthz": worker.live = ok
+            else: worker.ready = ok
+        if not worker.live and time.time() - worker.started_at > STARTUP_GRACE:
+            print(f"[cluster] 工作程序 {worker.cluster_id} 健康檢查失敗，重新啟動")
+            worker.proc.terminate()
+
+    async def _poll_loop(self):
+        while not self._stopping:
+            await asyncio.gather(*(self._poll(w) for w in self.workers))
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def _summary(self, worker):
+        return {
+            "cluster": worker.cluster_id,
+            "shards": [worker.shard_ids[0], worker.shard_ids[-1]],
+            "running": worker.running(),
+            "live": worker.live,
+            "ready": worker.ready,
+            "restarts": worker.restarts,
+        }
+
+    def liveness(self):
+        # 卡住的工作程序由主程序自己重啟，能回應就代表主程序正常
+        return True, {"workers": [self._summary(w) for w in self.workers]}
+
+    def readiness(self):
+        ok = all(w.ready for w in self.workers)
+        return ok, {"workers": [dict(self._summary(w), details=w.details) for w in self.workers]}
+
+    async def _fetch_metrics(self, worker):
+        if not worker.running(): return ""
+        try:
+            async with self.session.get(f"{worker.url}/metrics") as resp:
+                return await resp.text()
+        except Exception:
+            return ""
+
+    async def render_metrics(self):
+        texts = await asyncio.gather(*(self._fetch_metrics(w) for w in self.workers))
+        sources = [(w.cluster_id, text) for w, text in zip(self.workers, texts)]
+        sources.append(("supervisor", REGISTRY.render()))
+        return merge_metrics(sources)
+
+    def stop(self):
+        self._stopping = True
+        for worker in self.workers:
+            if worker.running(): worker.proc.terminate()
+        self.stopped.set()
+
+async def main():
+    token = os.environ.get("DISCORD_TOKEN")
+    if not token: raise SystemExit("請設定 DISCORD_TOKEN")
+    shard_count = int(os.environ["SHARD_COUNT"]) if os.environ.get("SHARD_COUNT") else await recommended_shards(token)
+    workers = int(os.environ.get("CLUSTER_WORKERS", os.cpu_count() or 1))
+    supervisor = ClusterSupervisor(shard_count, workers)
+    print(f"[cluster] {shard_count} 個分片 / {len(supervisor.workers)} 個工作程序")
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try: loop.add_signal_handler(sig, supervisor.stop)
+        except NotImplementedError: pass
+    run = asyncio.create_task(supervisor.run())
+    stopped = asyncio.create_task(supervisor.stopped.wait())
+    done, _ = await asyncio.wait({run, stopped}, return_when=asyncio.FIRST_COMPLETED)
+    if run in done:
+        # 主程序本身出錯 (例如連接埠被占用)，先收掉工作程序再把錯誤丟出去
+        supervisor.stop()
+    await asyncio.gather(*(w.proc.wait() for w in supervisor.workers if w.proc), return_exceptions=True)
+    if run in done: run.result()
+    run.cancel()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+import os
+import time
+import discord
+
+# 成員快取模式
+# full：啟動時下載所有伺服器的完整成員清單，並接收狀態更新，人數統計為精確值
+# lite：不預先下載成員、只快取語音頻道中的成員、不接收狀態更新
+#       統計頻道改用 fetch_guild(with_counts=True) 的概略人數，機器人數以機器人專屬身分組估算
+# 兩種模式的記憶體與啟動時間會在 on_ready 時印在「啟動耗時」那一行，可直接比較
+#
+# 實測 (bench_bot.py startup：假 gateway 資料交給 discord.py 2.7.1 解析，Python 3.13，
+#       分段請求回應延遲 100 ms，30% 成員在線、1% 在語音；RSS 為 READY 前後的差值)
+#   伺服器 x 成員      模式   READY -> on_ready   快取成員     RSS 增加
+#   100 x 1,000        full        4.2 秒          100,100      +96 MB
+#                      lite        2.0 秒            1,100       +1 MB
+#   10 x 50,000        full        9.9 秒          500,010     +290 MB
+#                      lite        2.2 秒            5,010       +4 MB
+#   300 x 2,000        full      124.8 秒          600,300     +604 MB
+#                      lite        2.3 秒            6,300       +7 MB
+# 兩種模式都包含 discord.py 在最後一個 GUILD_CREATE 後固定等待的 2 秒
+# full 模式每個大伺服器要送一次成員分段請求，超過 gateway 每分鐘 110 次的限制後每批要多等一分鐘，
+# 伺服器越多啟動時間越長；實際連線還要加上網路延遲，數字只適合比較兩種模式的差距
+MEMBER_CACHE_MODE = os.environ.get("MEMBER_CACHE_MODE", "full").lower()
+LOW_MEMORY = MEMBER_CACHE_MODE == "lite"
+
+# 多久強制用完整掃描校正一次 (秒)，避免漏掉事件造成在線人數漂移
+RECONCILE_INTERVAL = 6 * 3600
+
+class MemberCounter:
+    """
+    單一伺服器的人數計數器
+    由 on_member_join / on_member_remove / on_presence_update 即時增減，讀取為 O(1)
+    """
+
+    __slots__ = ("guild_id", "total", "bots", "online", "reconciled_at")
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.total = 0
+        self.bots = 0
+        self.online = 0
+        self.reconciled_at = 0.0
+
+    @property
+    def humans(self):
+        return self.total - self.bots
+
+    @staticmethod
+    def _is_online(member):
+        return member.status != discord.Status.offline
+
+    def reconcile(self, guild):
+        """完整掃描一次成員快取，重新計算所有數字"""
+        bots = online = 0
+        for m in guild.members:
+            if m.bot: bots += 1
+            if self._is_online(m): online += 1
+        self.total = guild.member_count or len(guild.members)
+        self.bots = bots
+        self.online = online
+        self.reconciled_at = time.time()
+
+    def needs_reconcile(self, guild):
+        if guild.member_count is not None and guild.member_count != self.total:
+            return True
+        return time.time() - self.reconciled_at > RECONCILE_INTERVAL
+
+    def member_join(self, member):
+        self.total += 1
+        if member.bot: self.bots += 1
+        if self._is_online(member): self.online += 1
+
+    def member_remove(self, member):
+        self.total = max(self.total - 1, 0)
+        if member.bot: self.bots = max(self.bots - 1, 0)
+        if self._is_online(member): self.online = max(self.online - 1, 0)
+
+    def presence_update(self, before, after):
+        was, now = self._is_online(before), self._is_online(after)
+        if was and not now: self.online = max(self.online - 1, 0)
+        elif now and not was: self.online += 1
+
+    def snapshot(self):
+        return {"total": self.total, "humans": self.humans, "online": self.online, "bots": self.bots}
+
+
+member_counters = {}
+
+async def refresh_approximate_counter(bot, guild):
+    """精簡模式用：向 API 取得概略人數，不需要完整成員快取"""
+    counter = member_counters.get(guild.id)
+    if counter is None:
+        counter = member_counters[guild.id] = MemberCounter(guild.id)
+    data = await bot.fetch_guild(guild.id, with_counts=True)
+    counter.total = data.approximate_member_count or guild.member_count or 0
+    counter.online = data.approximate_presence_count or 0
+    # 每個以 bot 權限加入的機器人都會有一個受管理的專屬身分組
+    counter.bots = sum(1 for role in guild.roles if role.is_bot_managed())
+    counter.reconciled_at = time.time()
+    return counter
+
+def get_member_counter(guild):
+    """取得伺服器的計數器，第一次使用或數字可能失準時會先完整校正"""
+    counter = member_counters.get(guild.id)
+    if counter is None:
+        counter = member_counters[guild.id] = MemberCounter(guild.id)
+        counter.reconcile(guild)
+    elif counter.needs_reconcile(guild):
+        counter.reconcile(guild)
+    return counter
@@ -0,0 +1,146 @@
+import asyncio
+import bisect
+import time
+
+# =========================================================
+# ===== Prometheus 格式指標 =====
+# =========================================================
+# 記錄與 /metrics 輸出都在 bot 的事件迴圈上進行 (server.py)，只做 dict / list 的加法，不加鎖
+# 抓取時才組成文字，組字串的過程中沒有 await，不會遇到迭代中被修改的問題，熱路徑上幾乎沒有額外成本
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{_escape(v)}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name, doc, labels=()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+class Gauge:
+    def __init__(self, name, doc, labels=()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self._values = {}
+
+    def set(self, value, *label_values):
+        self._values[label_values] = value
+
+    def get(self, *label_values):
+        return self._values.get(label_values)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}   # label -> [各區間次數..., +Inf 次數, 總和]
+
+    def observe(self, value, *label_values):
+        data = self._values.get(label_values)
+        if data is None:
+            data = self._values[label_values] = [0] * (len(self.buckets) + 2)
+        data[bisect.bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    def time(self, *label_values):
+        return _Timer(self, label_values)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for key, data in sorted(self._values.items()):
+            data = list(data)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), data[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {data[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+class _Timer:
+    __slots__ = ("histogram", "label_values", "start")
+
+    def __init__(self, histogram, label_values):
+        self.histogram, self.label_values = histogram, label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+class CallbackMetric:
+    """抓取時才呼叫 fn 取得數值，fn 回傳 [(label 值 tuple, 數值), ...]"""
+
+    def __init__(self, name, doc, kind, labels, fn):
+        self.name, self.doc, self.kind, self.labels, self.fn = name, doc, kind, tuple(labels), fn
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            samples = list(self.fn())
+        except Exception:
+            # 抓取時 bot 狀態可能正在變動，這次就略過
+            samples = []
+        for key, value in samples:
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, doc, labels=()):
+        return self.register(Counter(name, doc, labels))
+
+    def gauge(self, name, doc, labels=()):
+        return self.register(Gauge(name, doc, labels))
+
+    def histogram(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, doc, labels, buckets))
+
+    def callback(self, name, doc, kind="gauge", labels=(), fn=None):
+        return self.register(CallbackMetric(name, doc, kind, labels, fn))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# ===== 事件迴圈延遲 =====
+loop_lag = REGISTRY.gauge("bot_event_loop_lag_seconds", "事件迴圈排程延遲 (預期喚醒時間與實際喚醒時間的差)")
+
+async def monitor_loop_lag(interval=1.0):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        loop_lag.set(max(loop.time() - expected, 0.0))
@@ -0,0 +1,142 @@
+import asyncio
+import datetime
+import time
+from collections import defaultdict
+
+import discord
+
+from metrics import REGISTRY
+
+moderation_actions = REGISTRY.counter("bot_moderation_actions_total", "過濾器處分動作次數", ["action", "result"])
+
+TIMEOUT_SECONDS = 60
+BATCH_LIMIT = 100        # 一次從佇列取出的最大違規數 (bulk_delete 上限也是 100)
+DIGEST_INTERVAL = 10     # 違規紀錄彙整後送出的間隔 (秒)
+DIGEST_MAX_LINES = 20    # 每則彙整紀錄最多列出的違規數
+
+class Violation:
+    __slots__ = ("message", "hit_word", "log_channel_id", "at")
+
+    def __init__(self, message, hit_word, log_channel_id):
+        self.message = message
+        self.hit_word = hit_word
+        self.log_channel_id = log_channel_id
+        self.at = time.time()
+
+class ModerationPipeline:
+    """
+    過濾器處分佇列
+    on_message 只負責把違規丟進佇列，刪除與禁言由背景工作執行
+    * 佇列堆積時一次取出多筆，同一頻道的多則訊息用 bulk_delete 一次刪除
+    * 刪除與禁言同時進行，同一位成員禁言期間不重複禁言
+    * 違規紀錄定期彙整成一則 embed，避免洗版與撞到頻率限制
+    """
+
+    def __init__(self, bot, workers=2, max_pending=5000):
+        self.bot = bot
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self._timed_out = {}                 # (伺服器ID, 成員ID) -> 禁言結束時間
+        self._digest = defaultdict(list)     # 紀錄頻道ID -> [Violation]
+        self._tasks = []
+
+    def start(self):
+        if self._tasks: return
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(loop.create_task(self._digest_loop()))
+
+    def submit(self, message, hit_word, log_channel_id):
+        try:
+            self.queue.put_nowait(Violation(message, hit_word, log_channel_id))
+        except asyncio.QueueFull:
+            moderation_actions.inc("enqueue", "dropped")
+
+    async def _worker(self):
+        while True:
+            batch = [await self.queue.get()]
+            # 突發大量違規時一次處理一批，讓同頻道訊息可以合併刪除
+            while len(batch) < BATCH_LIMIT and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self._handle(batch)
+            except Exception:
+                moderation_actions.inc("batch", "error")
+            finally:
+                for _ in batch: self.queue.task_done()
+
+    async def _handle(self, batch):
+        by_channel = defaultdict(list)
+        offenders = {}
+        for v in batch:
+            by_channel[v.message.channel.id].append(v.message)
+            member = v.message.author
+            if isinstance(member, discord.Member):
+                offenders[(member.guild.id, member.id)] = member
+            if v.log_channel_id:
+                self._digest[v.log_channel_id].append(v)
+
+        jobs = [self._delete(messages) for messages in by_channel.values()]
+        now = time.time()
+        for key, member in offenders.items():
+            if self._timed_out.get(key, 0) > now: continue
+            self._timed_out[key] = now + TIMEOUT_SECONDS
+            jobs.append(self._timeout(member))
+        await asyncio.gather(*jobs)
+
+        # 清掉已過期的禁言紀錄
+        if len(self._timed_out) > 1000:
+            self._timed_out = {k: t for k, t in self._timed_out.items() if t > now}
+
+    async def _delete(self, messages):
+        channel = messages[0].channel
+        try:
+            if len(messages) == 1:
+                await messages[0].delete()
+                moderation_actions.inc("delete", "ok")
+            else:
+                await channel.delete_messages(messages)
+                moderation_actions.inc("bulk_delete", "ok")
+        except discord.NotFound:
+            # 訊息已被刪除
+            moderation_actions.inc("delete", "not_found")
+        except Exception:
+            moderation_actions.inc("bulk_delete" if len(messages) > 1 else "delete", "failed")
+
+    async def _timeout(self, member):
+        try:
+            await member.timeout(datetime.timedelta(seconds=TIMEOUT_SECONDS), reason="使用不雅詞彙")
+            moderation_actions.inc("timeout", "ok")
+        except Exception:
+            moderation_actions.inc("timeout", "failed")
+
+    async def _digest_loop(self):
+        while True:
+            await asyncio.sleep(DIGEST_INTERVAL)
+            pending, self._digest = self._digest, defaultdict(list)
+            await asyncio.gather(*(self._send_digest(cid, items) for cid, items in pending.items()))
+
+    async def _send_digest(self, channel_id, items):
+        channel = self.bot.get_channel(channel_id)
+        if not channel:
+            moderation_actions.inc("log", "failed")
+            return
+        if len(items) == 1:
+            v = items[0]
+            embed = discord.Embed(title="違規紀錄", color=0xff0000)
+            embed.add_field(name="用戶", value=v.message.author.mention)
+            embed.add_field(name="違規內容", value=v.message.content[:1024] or "(空白)")
+            embed.add_field(name="觸發詞彙", value=v.hit_word)
+        else:
+            lines = []
+            for v in items[:DIGEST_MAX_LINES]:
+                content = v.message.content.replace("\n", " ")[:80]
+                lines.append(f"<t:{int(v.at)}:T> {v.message.author.mention} 「{content}」 (觸發: {v.hit_word})")
+            if len(items) > DIGEST_MAX_LINES:
+                lines.append(f"……另外 {len(items) - DIGEST_MAX_LINES} 筆")
+            embed = discord.Embed(title=f"違規紀錄彙整 ({len(items)} 筆)", description="\n".join(lines)[:4096], color=0xff0000)
+        try:
+            await channel.send(embed=embed)
+            moderation_actions.inc("log", "ok")
+        except Exception:
+            moderation_actions.inc("log", "failed")
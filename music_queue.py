@@ -0,0 +1,173 @@
+import random
+
+class Track:
+    """
+    待播清單中的一首歌
+    上傳的音檔有 cache_key 與 size，網址歌曲兩者皆為 None，播放前才解析串流
+    """
+
+    __slots__ = ("url", "title", "duration", "requester", "cache_key", "size")
+
+    def __init__(self, url, title, duration=None, requester=None, cache_key=None, size=None):
+        self.url = url
+        self.title = title
+        self.duration = duration
+        self.requester = requester
+        self.cache_key = cache_key
+        self.size = size
+
+    def __repr__(self):
+        return f"Track({self.title!r})"
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data.get(name) for name in cls.__slots__})
+
+class TrackQueue:
+    """
+    待播清單
+    歌曲依加入順序放在陣列中，移除時只留下空位，另用 Fenwick tree 記錄每個位置是否還在
+    * 加入 / 取出下一首 / 第 i 首 / 移除第 i 首 / 跳到第 i 首：O(log n)
+    * 隨機排序：O(n)
+    空位超過一半時整理一次，攤還後仍為 O(log n)
+    """
+
+    def __init__(self, tracks=()):
+        self.version = 0  # 每次修改都會增加，用來判斷是否需要重新存檔
+        self._rebuild(list(tracks))
+
+    def _rebuild(self, tracks):
+        n = len(tracks)
+        self._slots = tracks        # Track 或 None (已移除)
+        self._tree = [0] + [1] * n  # Fenwick tree，1-indexed
+        for i in range(1, n + 1):
+            j = i + (i & -i)
+            if j <= n: self._tree[j] += self._tree[i]
+        self._start = 0             # 第一首之前的位置都已播放或被跳過
+        self._len = n
+        self.version += 1
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def _prefix(self, i):
+        """slots[0:i] 中還在的數量"""
+        tree, total = self._tree, 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _mark_removed(self, pos):
+        self._slots[pos] = None
+        tree, i = self._tree, pos + 1
+        while i < len(tree):
+            tree[i] -= 1
+            i += i & -i
+
+    def _find(self, k):
+        """回傳第 k 個 (從 0 起算) 還在的位置"""
+        tree, pos = self._tree, 0
+        step = 1 << (len(tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(tree) and tree[nxt] <= k:
+                pos = nxt
+                k -= tree[nxt]
+            step >>= 1
+        return pos
+
+    def _locate(self, index):
+        if index < 0: index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("待播清單索引超出範圍")
+        return self._find(self._prefix(self._start) + index)
+
+    def _compact(self):
+        if len(self._slots) > 64 and len(self._slots) > 2 * self._len:
+            self._rebuild(list(self))
+
+    def append(self, track):
+        self._slots.append(track)
+        n = len(self._slots)
+        low = n & -n
+        # 新節點涵蓋 (n - low, n]，其中前 low - 1 個是舊位置
+        self._tree.append(self._prefix(n - 1) - self._prefix(n - low) + 1)
+        self._len += 1
+        self.version += 1
+
+    def extend(self, tracks):
+        for track in tracks: self.append(track)
+
+    def popleft(self):
+        if not self._len: raise IndexError("待播清單是空的")
+        pos = self._locate(0)
+        track = self._slots[pos]
+        self._mark_removed(pos)
+        self._start = pos + 1
+        self._len -= 1
+        self.version += 1
+        self._compact()
+        return track
+
+    def __getitem__(self, index):
+        return self._slots[self._locate(index)]
+
+    def remove_at(self, index):
+        """移除第 index 首並回傳"""
+        pos = self._locate(index)
+        track = self._slots[pos]
+        self._mark_removed(pos)
+        self._len -= 1
+        self.version += 1
+        self._compact()
+        return track
+
+    def jump(self, index):
+        """
+        直接讓第 index 首成為下一首，回傳被跳過的數量
+        被跳過的歌曲只移動起點，不逐一刪除
+        """
+        if index < 0: index += self._len
+        self._start = self._locate(index)
+        self._len -= index
+        self.version += 1
+        self._compact()
+        return index
+
+    def shuffle(self):
+        tracks = list(self)
+        random.shuffle(tracks)
+        self._rebuild(tracks)
+
+    def clear(self):
+        self._rebuild([])
+
+    def __iter__(self):
+        slots = self._slots
+        for pos in range(self._start, len(slots)):
+            if slots[pos] is not None: yield slots[pos]
+
+    def page(self, offset, limit):
+        """回傳從第 offset 首開始最多 limit 首"""
+        if offset >= self._len or limit <= 0: return []
+        slots, result = self._slots, []
+        pos = self._locate(offset)
+        while pos < len(slots) and len(result) < limit:
+            if slots[pos] is not None: result.append(slots[pos])
+            pos += 1
+        return result
+
+def format_duration(seconds):
+    """秒數轉成 m:ss 或 h:mm:ss，未知長度回傳 --:--"""
+    if seconds is None: return "--:--"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
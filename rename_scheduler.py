@@ -0,0 +1,175 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+
+import discord
+
+# Discord 對頻道改名的限制：每個頻道 10 分鐘內約 2 次
+RENAME_LIMIT = 2
+RENAME_WINDOW = 600
+
+class ChannelRenameScheduler:
+    """
+    統計頻道改名排程器
+    * 名稱沒變就不送出
+    * 同一頻道排隊中的名稱只保留最新的一個
+    * 追蹤每個頻道的改名額度，額度用完就排到下一個可用時間
+    * 已到可執行時間的項目中，改名次數少的伺服器優先
+    * 每次改名是獨立的工作，某個頻道遇到 429 長時間等待也不會擋住其他伺服器
+    """
+
+    def __init__(self, limit=RENAME_LIMIT, window=RENAME_WINDOW):
+        self.limit = limit
+        self.window = window
+        self._heap = []          # (可執行時間, 序號, 頻道ID)，等待額度的項目
+        self._ready = []         # (伺服器已改名次數, 序號, 頻道ID)，已可執行的項目
+        self._inflight = set()   # 正在改名的頻道ID
+        self._tasks = set()
+        self._seq = itertools.count()
+        self._pending = {}       # 頻道ID -> (channel, 最新名稱)
+        self._applied = {}       # 頻道ID -> 最後成功套用的名稱
+        self._history = {}       # 頻道ID -> deque[改名時間]
+        self._blocked = {}       # 頻道ID -> 429 解除時間
+        self._guild_turns = {}   # 伺服器ID -> 已送出的改名次數
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.stats = {"sent": 0, "skipped": 0, "coalesced": 0, "rate_limited": 0, "failed": 0}
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._worker())
+
+    def stop(self):
+        if self._task: self._task.cancel()
+        for task in list(self._tasks): task.cancel()
+
+    def _next_slot(self, channel_id, now):
+        """回傳此頻道下次可以改名的時間"""
+        blocked = self._blocked.get(channel_id, 0)
+        if blocked <= now: self._blocked.pop(channel_id, None)
+        history = self._history.get(channel_id)
+        if not history: return max(now, blocked)
+        while history and now - history[0] >= self.window:
+            history.popleft()
+        if len(history) < self.limit: return max(now, blocked)
+        return max(history[0] + self.window, blocked)
+
+    def submit(self, channel, name):
+        """排入改名請求，回傳是否真的需要改名"""
+        cid = channel.id
+        current = self._applied.get(cid, channel.name)
+        if cid in self._pending:
+            if self._pending[cid][1] == name: return False
+            if current == name:
+                # 排隊中的名稱又改回現在的名稱，直接取消
+                del self._pending[cid]
+                self.stats["skipped"] += 1
+                return False
+            # 已在佇列中，只更新成最新名稱
+            self._pending[cid] = (channel, name)
+            self.stats["coalesced"] += 1
+            return True
+        if current == name:
+            self.stats["skipped"] += 1
+            return False
+
+        self._pending[cid] = (channel, name)
+        self._push(channel, self._next_slot(cid, time.monotonic()))
+        return True
+
+    def _push(self, channel, ready_at):
+        heapq.heappush(self._heap, (ready_at, next(self._seq), channel.id))
+        self._wakeup.set()
+
+    def pending_count(self):
+        return len(self._pending)
+
+    async def _worker(self):
+        while True:
+            # 到期的項目移到就緒佇列，依伺服器改名次數排序 (次數以取出當下為準)
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                _, seq, cid = heapq.heappop(self._heap)
+                item = self._pending.get(cid)
+                if item is None: continue
+                turns = self._guild_turns.get(item[0].guild.id, 0)
+                heapq.heappush(self._ready, (turns, seq, cid))
+
+            if not self._ready:
+                # 等到最早的項目可以執行，期間有新項目進來就重新檢查
+                self._wakeup.clear()
+                delay = self._heap[0][0] - now if self._heap else None
+                try: await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError: pass
+                continue
+
+            _, _, cid = heapq.heappop(self._ready)
+            # 改名中的頻道等目前這次結束後再排入
+            if cid in self._inflight: continue
+            item = self._pending.pop(cid, None)
+            if item is None: continue
+            channel, name = item
+
+            slot = self._next_slot(cid, now)
+            if slot > now:
+                self._pending[cid] = item
+                self._push(channel, slot)
+                continue
+
+            gid = channel.guild.id
+            self._guild_turns[gid] = self._guild_turns.get(gid, 0) + 1
+            self._inflight.add(cid)
+            task = asyncio.get_running_loop().create_task(self._run_rename(channel, name))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            await asyncio.sleep(0)
+
+    async def _run_rename(self, channel, name):
+        cid = channel.id
+        try:
+            await self._rename(channel, name)
+        finally:
+            self._inflight.discard(cid)
+            # 改名期間又送進新的名稱，重新排入
+            if cid in self._pending:
+                self._push(channel, self._next_slot(cid, time.monotonic()))
+
+    async def _rename(self, channel, name):
+        cid = channel.id
+        try:
+            await channel.edit(name=name)
+        except discord.RateLimited as e:
+            self._retry_later(channel, name, e.retry_after)
+            return
+        except discord.NotFound:
+            # 頻道已被刪除，不再追蹤
+            self._forget(cid)
+            self.stats["failed"] += 1
+            return
+        except discord.HTTPException as e:
+            if e.status == 429:
+                self._retry_later(channel, name, self.window / self.limit)
+            else:
+                self.stats["failed"] += 1
+            return
+        except Exception:
+            self.stats["failed"] += 1
+            return
+
+        self._applied[cid] = name
+        self._history.setdefault(cid, deque()).append(time.monotonic())
+        self.stats["sent"] += 1
+
+    def _retry_later(self, channel, name, retry_after):
+        self.stats["rate_limited"] += 1
+        # 期間若有更新的名稱就保留新的，改名工作結束時會依解除時間重新排入
+        self._blocked[channel.id] = time.monotonic() + retry_after
+        self._pending.setdefault(channel.id, (channel, name))
+
+    def _forget(self, channel_id):
+        self._pending.pop(channel_id, None)
+        self._applied.pop(channel_id, None)
+        self._history.pop(channel_id, None)
+        self._blocked.pop(channel_id, None)
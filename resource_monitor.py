@@ -0,0 +1,82 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+# 取樣間隔與保留時間 (秒)，預設每 10 秒一筆、保留一小時 = 每個項目 360 筆
+RESOURCE_SAMPLE_INTERVAL = float(os.environ.get("RESOURCE_SAMPLE_INTERVAL", 10))
+RESOURCE_WINDOW = 3600
+
+def percentile(sorted_values, p):
+    """最近排名法，sorted_values 需已排序且不為空"""
+    index = min(len(sorted_values) - 1, max(int(round(p / 100 * (len(sorted_values) - 1))), 0))
+    return sorted_values[index]
+
+class ResourceSampler:
+    """
+    背景資源取樣
+    固定間隔記錄一次各項數值，每個項目存在固定長度的環狀緩衝區
+    process_* / host_* 由 psutil 在執行緒中讀取，其餘項目由 add_source 註冊的函式在事件迴圈上讀取
+    psutil 的 cpu_percent 是與上一次呼叫的差值，所以重複使用同一個 Process 物件，第一筆只用來暖機
+    """
+
+    def __init__(self, interval=RESOURCE_SAMPLE_INTERVAL, window=RESOURCE_WINDOW):
+        self.interval = interval
+        self.window = window
+        self.size = int(window // interval) + 1
+        self.series = {}      # 項目名稱 -> deque[(時間, 數值)]
+        self._sources = {}    # 項目名稱 -> 回傳數值 (或 None) 的函式
+        self._proc = None
+        self._task = None
+
+    def add_source(self, name, fn):
+        self._sources[name] = fn
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    def _sample_process(self):
+        import psutil
+        values = {}
+        if self._proc is None:
+            self._proc = psutil.Process()
+            self._proc.cpu_percent(None)
+            psutil.cpu_percent(None)
+        else:
+            values["process_cpu"] = self._proc.cpu_percent(None) / (psutil.cpu_count() or 1)
+            values["host_cpu"] = psutil.cpu_percent(None)
+        values["process_rss"] = self._proc.memory_info().rss / 1024 / 1024
+        values["host_memory"] = psutil.virtual_memory().percent
+        return values
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                values = await loop.run_in_executor(None, self._sample_process)
+            except Exception:
+                values = {}
+            for name, fn in self._sources.items():
+                try: values[name] = fn()
+                except Exception: pass
+            self.record(values)
+            await asyncio.sleep(self.interval)
+
+    def record(self, values, now=None):
+        now = time.time() if now is None else now
+        for name, value in values.items():
+            if value is None: continue
+            buf = self.series.get(name)
+            if buf is None:
+                buf = self.series[name] = deque(maxlen=self.size)
+            buf.append((now, value))
+
+    def summary(self, name, window=None, now=None):
+        """回傳 (目前, p50, p95, 最大)，沒有資料回傳 None"""
+        buf = self.series.get(name)
+        if not buf: return None
+        since = (time.time() if now is None else now) - (window or self.window)
+        values = sorted(v for t, v in buf if t >= since)
+        if not values: return None
+        return buf[-1][1], percentile(values, 50), percentile(values, 95), values[-1]
@@ -1,19 +1,62 @@
-from flask import Flask
-from threading import Thread
+from aiohttp import web
+import inspect
 import os
+from metrics import REGISTRY
 
-app = Flask('')
+# Koyeb 會自動分配 PORT，必須監聽 0.0.0.0
+PORT = int(os.environ.get("PORT", 8000))
+# 分片模式的工作程序只給 cluster.py 存取，改為監聽 127.0.0.1
+HOST = os.environ.get("HEALTH_HOST", "0.0.0.0")
 
-@app.route('/')
-def home():
-    return "Bot is running and staying alive!"
+class HealthServer:
+    """
+    跑在 bot 事件迴圈上的健康檢查服務
+    /healthz：存活檢查，失敗代表程式卡住，平台應該重啟
+    /readyz ：就緒檢查，失敗代表暫時無法服務 (例如 gateway 斷線重連中)
+    /metrics：Prometheus 指標
+    liveness / readiness 為回傳 (是否正常, 詳細資料 dict) 的函式
+    render 為回傳指標文字的函式 (可以是 async)，預設輸出本程序的 REGISTRY
+    """
 
-def run():
-    # Koyeb 會自動分配 PORT，必須監聽 0.0.0.0
-    port = int(os.environ.get("PORT", 8000))
-    app.run(host='0.0.0.0', port=port)
+    def __init__(self, liveness, readiness, host=HOST, port=PORT, render=None):
+        self.liveness = liveness
+        self.readiness = readiness
+        self.render = render or REGISTRY.render
+        self.host = host
+        self.port = port
+        self._runner = None
 
-def keep_alive():
-    t = Thread(target=run)
-    t.daemon = True # 確保主程式結束時執行緒也會關閉
-    t.start()
+        app = web.Application()
+        app.router.add_get("/", self.home)
+        app.router.add_get("/healthz", self.healthz)
+        app.router.add_get("/readyz", self.readyz)
+        app.router.add_get("/metrics", self.metrics)
+        self.app = app
+
+    async def home(self, request):
+        return web.Response(text="Bot is running and staying alive!")
+
+    @staticmethod
+    def _check(fn):
+        ok, details = fn()
+        return web.json_response({"ok": ok, **details}, status=200 if ok else 503)
+
+    async def healthz(self, request):
+        return self._check(self.liveness)
+
+    async def readyz(self, request):
+        return self._check(self.readiness)
+
+    async def metrics(self, request):
+        text = self.render()
+        if inspect.isawaitable(text): text = await text
+        return web.Response(body=text.encode(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner: await self._runner.cleanup()
@@ -0,0 +1,47 @@
+import os
+
+# 分片設定，全部未設定時維持單一程序、不分片 (commands.Bot)
+# SHARDED=1   ：改用 AutoShardedBot，分片數由 Discord 建議，所有分片在同一個程序
+# SHARD_COUNT ：總分片數，設定後改用 AutoShardedBot
+# SHARD_IDS   ：此程序負責的分片，例如 "0,1,2"，未設定時負責全部分片 (需要同時設定 SHARD_COUNT)
+# CLUSTER_ID  ：cluster.py 指定的工作程序編號，只有 0 號負責同步斜線指令
+# 多程序模式請執行 cluster.py，由它分配分片並啟動各個工作程序
+
+def _parse_ids(raw):
+    return [int(part) for part in raw.split(",") if part.strip()] if raw else None
+
+SHARD_COUNT = int(os.environ["SHARD_COUNT"]) if os.environ.get("SHARD_COUNT") else None
+SHARD_IDS = _parse_ids(os.environ.get("SHARD_IDS"))
+SHARDED = SHARD_COUNT is not None or os.environ.get("SHARDED") == "1"
+CLUSTER_ID = int(os.environ.get("CLUSTER_ID", 0))
+IS_PRIMARY = CLUSTER_ID == 0
+
+if SHARD_IDS is not None and SHARD_COUNT is None:
+    raise SystemExit("SHARD_IDS 需要同時設定 SHARD_COUNT")
+
+_owned = frozenset(SHARD_IDS) if SHARD_IDS is not None else None
+
+def shard_for(guild_id, shard_count):
+    """Discord 的分片規則：(伺服器ID >> 22) % 分片數"""
+    return (guild_id >> 22) % shard_count
+
+def owns_guild(guild_id):
+    """此程序是否負責這個伺服器，用來只還原自己分片的狀態"""
+    if _owned is None: return True
+    return shard_for(guild_id, SHARD_COUNT) in _owned
+
+def split_shards(shard_count, workers):
+    """把分片切成連續區段分給各工作程序，例如 10 個分片、3 個程序 -> [0-3], [4-6], [7-9]"""
+    workers = max(min(workers, shard_count), 1)
+    size, extra = divmod(shard_count, workers)
+    ranges, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+def bot_options():
+    """AutoShardedBot 的分片參數"""
+    if not SHARDED: return {}
+    return {"shard_count": SHARD_COUNT, "shard_ids": SHARD_IDS}
@@ -0,0 +1,101 @@
+import json
+import os
+import sqlite3
+from contextlib import closing
+import threading
+import time
+
+DB_PATH = os.environ.get("STATE_DB_PATH", "bot_state.db")
+
+class StateStore:
+    """
+    以 SQLite 保存機器人狀態 (語音掛機、統計頻道、過濾設定、待播清單)
+    寫入採 write-behind：指令只把資料放進待寫表，由背景執行緒合併後整批寫入
+    同一筆資料在一次寫入前被修改多次，只會寫最後一次
+    """
+
+    def __init__(self, path=DB_PATH, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._pending = {}   # (ns, key) -> JSON 字串，None 表示刪除
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self.writes = 0
+        self.errors = 0
+        # sqlite3 連線的 with 只負責 commit / rollback，不會關閉連線
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                "ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, updated_at REAL NOT NULL,"
+                "PRIMARY KEY (ns, key))"
+            )
+        self._thread = threading.Thread(target=self._writer, name="state-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self, ns):
+        """讀取某個分類的所有資料，key 為數字時轉回 int (伺服器 ID)"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT key, value FROM state WHERE ns = ?", (ns,)).fetchall()
+        result = {}
+        for key, value in rows:
+            result[int(key) if key.isdigit() else key] = json.loads(value)
+        return result
+
+    def set(self, ns, key, value):
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._pending[(ns, str(key))] = data
+        self._wakeup.set()
+
+    def delete(self, ns, key):
+        with self._lock:
+            self._pending[(ns, str(key))] = None
+        self._wakeup.set()
+
+    def _writer(self):
+        conn = self._connect()
+        while True:
+            self._wakeup.wait()
+            if not self._closed:
+                # 等一下讓短時間內的多次修改合併成一次交易
+                time.sleep(self.flush_interval)
+            self._wakeup.clear()
+            self._flush(conn)
+            if self._closed:
+                conn.close()
+                return
+
+    def _flush(self, conn):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch: return
+        now = time.time()
+        upserts = [(ns, key, value, now) for (ns, key), value in batch.items() if value is not None]
+        deletes = [(ns, key) for (ns, key), value in batch.items() if value is None]
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO state (ns, key, value, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (ns, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                    upserts
+                )
+                conn.executemany("DELETE FROM state WHERE ns = ? AND key = ?", deletes)
+            self.writes += len(batch)
+        except sqlite3.Error:
+            self.errors += 1
+            # 寫入失敗就放回待寫表，較新的修改優先
+            with self._lock:
+                for k, v in batch.items(): self._pending.setdefault(k, v)
+            if not self._closed: self._wakeup.set()
+
+    def close(self):
+        """關閉前把剩下的資料寫完"""
+        if self._closed: return
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout=10)
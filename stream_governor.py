@@ -0,0 +1,122 @@
+import asyncio
+import os
+from collections import OrderedDict
+
+from metrics import REGISTRY
+
+stream_admissions = REGISTRY.counter("bot_stream_admissions_total", "ffmpeg 串流准入結果", ["result"])
+
+# 同時進行的 ffmpeg 轉碼數量上限
+MAX_STREAMS = int(os.environ.get("MAX_STREAMS", 4))
+# 所有 ffmpeg 子程序合計的 CPU 使用率上限 (佔整台機器的百分比)，超過時新串流一律排隊
+STREAM_CPU_LIMIT = float(os.environ.get("STREAM_CPU_LIMIT", 85))
+# 所有 ffmpeg 子程序合計的記憶體上限 (MB)，0 代表不限制
+STREAM_RSS_LIMIT_MB = float(os.environ.get("STREAM_RSS_LIMIT_MB", 512))
+# 沒有歌曲可播、也沒有人在排隊時，幾秒後自動離開語音
+IDLE_DISCONNECT = int(os.environ.get("IDLE_DISCONNECT", 300))
+
+SAMPLE_INTERVAL = 5.0
+
+class StreamGovernor:
+    """
+    ffmpeg 串流准入控制
+    * 每個伺服器最多佔用一個轉碼名額，名額用完時進入等待佇列
+    * 等待佇列依先來後到，同一個伺服器只排一次，名額釋放時依序交給下一個伺服器
+    * 背景定期取樣 ffmpeg 子程序的 CPU 與記憶體，超過上限時暫停發放新名額
+    所有方法都在 bot 的事件迴圈上呼叫，不加鎖
+    """
+
+    def __init__(self, max_streams=MAX_STREAMS, cpu_limit=STREAM_CPU_LIMIT, rss_limit_mb=STREAM_RSS_LIMIT_MB):
+        self.max_streams = max_streams
+        self.cpu_limit = cpu_limit
+        self.rss_limit = rss_limit_mb * 1024 * 1024
+        self.active = set()            # 佔用名額的伺服器ID
+        self.waiting = OrderedDict()   # 伺服器ID -> 取得名額後呼叫的函式
+        self.ffmpeg_count = 0
+        self.ffmpeg_cpu = 0.0          # 佔整台機器的百分比
+        self.ffmpeg_rss = 0            # bytes
+        self._procs = {}               # pid -> psutil.Process，保留物件 cpu_percent 才有前後差值
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._sample_loop())
+
+    def overloaded(self):
+        if self.cpu_limit and self.ffmpeg_cpu >= self.cpu_limit: return True
+        return bool(self.rss_limit) and self.ffmpeg_rss >= self.rss_limit
+
+    def _can_admit(self):
+        return len(self.active) < self.max_streams and not self.overloaded()
+
+    def acquire(self, guild_id, on_ready):
+        """
+        取得轉碼名額，成功回傳 True
+        失敗時排進等待佇列 (已在佇列中則保留原本的順序)，輪到時呼叫 on_ready()
+        on_ready() 回傳 False 代表已經不需要名額
+        """
+        if guild_id in self.active: return True
+        if not self.waiting and self._can_admit():
+            self.active.add(guild_id)
+            stream_admissions.inc("admitted")
+            return True
+        if guild_id not in self.waiting:
+            stream_admissions.inc("overloaded" if self.overloaded() else "queued")
+        self.waiting[guild_id] = on_ready
+        return False
+
+    def release(self, guild_id):
+        """停止播放或離開語音時歸還名額，同時取消排隊"""
+        self.waiting.pop(guild_id, None)
+        if guild_id in self.active:
+            self.active.discard(guild_id)
+            self._drain()
+
+    def holds(self, guild_id):
+        return guild_id in self.active
+
+    def position(self, guild_id):
+        """在等待佇列中的順位 (從 1 起算)，沒有排隊回傳 None"""
+        if guild_id not in self.waiting: return None
+        for i, gid in enumerate(self.waiting, start=1):
+            if gid == guild_id: return i
+
+    def _drain(self):
+        while self.waiting and self._can_admit():
+            guild_id, on_ready = self.waiting.popitem(last=False)
+            self.active.add(guild_id)
+            stream_admissions.inc("admitted")
+            try: started = on_ready() is not False
+            except Exception: started = False
+            if not started:
+                # 對方已經不需要播放，名額直接交給下一位
+                self.active.discard(guild_id)
+
+    def _sample(self):
+        """在執行緒中讀取 ffmpeg 子程序的 CPU / 記憶體"""
+        import psutil
+        procs = {}
+        cpu = 0.0
+        rss = 0
+        for child in psutil.Process().children(recursive=True):
+            proc = self._procs.get(child.pid, child)
+            try:
+                if "ffmpeg" not in proc.name().lower(): continue
+                cpu += proc.cpu_percent(None)
+                rss += proc.memory_info().rss
+            except psutil.Error:
+                continue
+            procs[child.pid] = proc
+        self._procs = procs
+        return len(procs), cpu / (psutil.cpu_count() or 1), rss
+
+    async def _sample_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                self.ffmpeg_count, self.ffmpeg_cpu, self.ffmpeg_rss = await loop.run_in_executor(None, self._sample)
+            except Exception:
+                pass
+            # 負載下降後放行排隊中的伺服器
+            self._drain()
+            await asyncio.sleep(SAMPLE_INTERVAL)
@@ -0,0 +1,115 @@
+import asyncio
+import random
+import time
+
+class ReconnectStats:
+    """單一伺服器的語音重連統計"""
+
+    __slots__ = ("attempts", "successes", "failures", "consecutive_failures",
+                 "last_error", "last_attempt", "last_success", "next_attempt")
+
+    def __init__(self):
+        self.attempts = 0
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.last_attempt = None
+        self.last_success = None
+        self.next_attempt = None
+
+class ReconnectSupervisor:
+    """
+    語音掛機重連管理
+    * 每個伺服器各自一個重連工作，彼此不互相等待
+    * 以 semaphore 限制同時進行的語音握手數量
+    * 失敗時以指數退避加上隨機抖動再重試
+    """
+
+    def __init__(self, bot, stay_channels, max_concurrency=5,
+                 base_delay=2.0, max_delay=300.0, connect_timeout=30.0):
+        self.bot = bot
+        self.stay_channels = stay_channels
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.connect_timeout = connect_timeout
+        self.stats = {}
+        self._max_concurrency = max_concurrency
+        self._semaphore = None
+        self._tasks = {}
+
+    def get_stats(self, guild_id):
+        stats = self.stats.get(guild_id)
+        if stats is None:
+            stats = self.stats[guild_id] = ReconnectStats()
+        return stats
+
+    def _backoff(self, failures):
+        # equal jitter：一半固定、一半隨機，避免所有伺服器同時重試
+        delay = min(self.max_delay, self.base_delay * (2 ** (failures - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _is_connected(self, guild):
+        return guild.voice_client is not None and guild.voice_client.is_connected()
+
+    def schedule(self, guild_id):
+        """安排伺服器重連並回傳重連工作，已有進行中的工作就沿用"""
+        task = self._tasks.get(guild_id)
+        if task and not task.done(): return task
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        task = self._tasks[guild_id] = asyncio.get_running_loop().create_task(self._run(guild_id))
+        return task
+
+    def check_all(self):
+        """輪詢用：把所有應掛機但未連線的伺服器排入重連"""
+        for gid in list(self.stay_channels):
+            guild = self.bot.get_guild(gid)
+            if guild and not self._is_connected(guild):
+                self.schedule(gid)
+
+    async def on_voice_state_update(self, member, before, after):
+        """機器人自己被斷線或踢出語音時立即重連"""
+        if member.id != self.bot.user.id: return
+        if before.channel and after.channel is None and member.guild.id in self.stay_channels:
+            self.schedule(member.guild.id)
+
+    async def _run(self, guild_id):
+        stats = self.get_stats(guild_id)
+        while guild_id in self.stay_channels:
+            guild = self.bot.get_guild(guild_id)
+            if not guild or self._is_connected(guild):
+                stats.consecutive_failures = 0
+                stats.next_attempt = None
+                return
+            channel = self.bot.get_channel(self.stay_channels[guild_id])
+            if not channel: return
+
+            async with self._semaphore:
+                # 等待期間可能已經被 /離開 或其他流程處理
+                if guild_id not in self.stay_channels or self._is_connected(guild): continue
+                stats.attempts += 1
+                stats.last_attempt = time.time()
+                try:
+                    if guild.voice_client:
+                        # 殘留的半連線狀態會讓 connect() 直接失敗
+                        await guild.voice_client.disconnect(force=True)
+                    await asyncio.wait_for(channel.connect(self_deaf=True), timeout=self.connect_timeout)
+                except Exception as e:
+                    stats.failures += 1
+                    stats.consecutive_failures += 1
+                    stats.last_error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+                else:
+                    stats.successes += 1
+                    stats.consecutive_failures = 0
+                    stats.last_success = time.time()
+                    stats.next_attempt = None
+                    return
+
+            delay = self._backoff(stats.consecutive_failures)
+            stats.next_attempt = time.time() + delay
+            await asyncio.sleep(delay)
+
+    def cancel(self, guild_id):
+        task = self._tasks.pop(guild_id, None)
+        if task: task.cancel()
@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import discord
+
+WELCOME_BURST = 3          # 短時間內可以立即送出的歡迎卡片數
+WELCOME_INTERVAL = 5.0     # 每隔幾秒恢復一次額度
+BATCH_MAX_MENTIONS = 30    # 合併訊息中最多標註的人數，其餘只計數
+
+def build_card(member):
+    embed = discord.Embed(
+        description=f"你好 歡迎加入 {member.guild.name}\n\n{member.mention}\n\n你是本伺服器的第 {member.guild.member_count} 位成員",
+        color=0x2b2d31
+    )
+    embed.set_thumbnail(url=member.display_avatar.url)
+    return embed
+
+def build_batch(guild, members, overflow):
+    mentions = " ".join(m.mention for m in members)
+    total = len(members) + overflow
+    if overflow: mentions += f"\n以及另外 {overflow} 位成員"
+    return discord.Embed(
+        description=f"歡迎 {total} 位新成員加入 {guild.name}\n\n{mentions}\n\n本伺服器目前共有 {guild.member_count} 位成員",
+        color=0x2b2d31
+    )
+
+class _GuildBuffer:
+    __slots__ = ("tokens", "updated", "pending", "overflow", "task")
+
+    def __init__(self):
+        self.tokens = float(WELCOME_BURST)
+        self.updated = time.monotonic()
+        self.pending = []
+        self.overflow = 0
+        self.task = None
+
+    def refill(self, now):
+        self.tokens = min(WELCOME_BURST, self.tokens + (now - self.updated) / WELCOME_INTERVAL)
+        self.updated = now
+
+class WelcomeBuffer:
+    """
+    歡迎訊息合併
+    每個伺服器有一個 token bucket，額度內的加入直接送出個人歡迎卡片
+    加入速度超過額度時，等下一次有額度再把這段期間加入的成員合併成一則訊息
+    合併訊息的標註人數有上限，超過的只顯示人數，佇列不會無限累積
+    """
+
+    def __init__(self):
+        self._guilds = {}
+        self.sent_cards = 0
+        self.sent_batches = 0
+        self.failed = 0
+
+    def member_join(self, member):
+        channel = member.guild.system_channel
+        if not channel: return
+        buf = self._guilds.get(member.guild.id)
+        if buf is None:
+            buf = self._guilds[member.guild.id] = _GuildBuffer()
+        now = time.monotonic()
+        buf.refill(now)
+
+        if buf.tokens >= 1 and not buf.pending:
+            buf.tokens -= 1
+            asyncio.get_running_loop().create_task(self._send(channel, build_card(member)))
+            self.sent_cards += 1
+            return
+
+        if len(buf.pending) < BATCH_MAX_MENTIONS: buf.pending.append(member)
+        else: buf.overflow += 1
+        if buf.task is None or buf.task.done():
+            buf.task = asyncio.get_running_loop().create_task(self._flush_later(member.guild, buf))
+
+    async def _flush_later(self, guild, buf):
+        while buf.pending:
+            buf.refill(time.monotonic())
+            if buf.tokens < 1:
+                await asyncio.sleep((1 - buf.tokens) * WELCOME_INTERVAL)
+                continue
+            buf.tokens -= 1
+            members, overflow = buf.pending, buf.overflow
+            buf.pending, buf.overflow = [], 0
+            channel = guild.system_channel
+            if not channel: return
+            if len(members) == 1 and not overflow:
+                embed = build_card(members[0])
+                self.sent_cards += 1
+            else:
+                embed = build_batch(guild, members, overflow)
+                self.sent_batches += 1
+            await self._send(channel, embed)
+
+    async def _send(self, channel, embed):
+        try: await channel.send(embed=embed)
+        except (discord.HTTPException, discord.RateLimited): self.failed += 1
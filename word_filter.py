@@ -0,0 +1,192 @@
+import re
+import unicodedata
+
+# ===== 擴充後的不雅語言詞庫 =====
+COMMON_PROFANITY = [
+    "幹", "靠", "屁", "垃圾", "智障", "腦癱", "死全家", "孤兒", 
+    "廢物", "去死", "操你媽", "你媽死了", "尼哥", "畜生", "雜種", 
+    "低能兒", "白癡", "腦殘", "傻逼", "機掰", "雞掰", "賤人", "賤貨",
+    "操", "肏", "幹你娘", "靠北", "靠腰", "三小", "幹林娘", "機歪",
+    "支那", "下流", "無恥", "欠幹", "狗娘養的", "尼瑪"
+]
+
+# =========================================================
+# ===== 文字正規化 (全形/半形/零寬字元 一次處理) =====
+# =========================================================
+# 零寬與不可見字元：常被拿來把關鍵字拆開躲避過濾
+ZERO_WIDTH_CHARS = (
+    "\u00ad"  # soft hyphen
+    "\u180e"  # mongolian vowel separator
+    "\u200b\u200c\u200d\u200e\u200f"
+    "\u2060\u2061\u2062\u2063\u2064"
+    "\ufeff"
+)
+
+def _build_translate_table():
+    table = {}
+    # 全形 ASCII (！ ~ ～) -> 半形
+    for code in range(0xFF01, 0xFF5F):
+        table[code] = chr(code - 0xFEE0)
+    table[0x3000] = " "  # 全形空白
+    # 半形片假名與符號 -> 全形
+    for code in range(0xFF61, 0xFFEF):
+        folded = unicodedata.normalize("NFKC", chr(code))
+        if len(folded) == 1 and folded != chr(code):
+            table[code] = folded
+    for ch in ZERO_WIDTH_CHARS:
+        table[ord(ch)] = None
+    # 英文不分大小寫 (包含剛轉成半形的全形英文)
+    for code in range(ord("A"), ord("Z") + 1):
+        table[code] = chr(code + 32)
+    for code in range(0xFF21, 0xFF3B):
+        table[code] = chr(code - 0xFEE0 + 32)
+    return table
+
+_TRANSLATE_TABLE = _build_translate_table()
+
+def normalize(text: str) -> str:
+    """
+    將訊息正規化後再比對
+    全形轉半形、半形片假名轉全形、移除零寬字元、英文轉小寫
+    """
+    return text.translate(_TRANSLATE_TABLE)
+
+
+# =========================================================
+# ===== Aho-Corasick 多關鍵字比對 =====
+# =========================================================
+class KeywordMatcher:
+    """
+    一次掃描訊息即可找出所有關鍵字
+    新增詞彙時只會標記需要重建，下一次比對前才重新計算失敗連結
+    """
+
+    def __init__(self, keywords=()):
+        self._goto = [{}]    # 每個狀態的轉移表
+        self._fail = [0]     # 失敗連結
+        self._word = [None]  # 剛好在此狀態結尾的關鍵字
+        self._out = [0]      # 失敗鏈上 (含自己) 最近的關鍵字結尾狀態，0 表示沒有
+        self._keywords = []
+        self._seen = set()
+        self._start_re = re.compile("(?!)")  # 所有關鍵字的第一個字
+        self._dirty = False
+        for word in keywords:
+            self.add(word)
+
+    def __len__(self):
+        return len(self._keywords)
+
+    def __contains__(self, word):
+        return normalize(word) in self._seen
+
+    @property
+    def keywords(self):
+        return list(self._keywords)
+
+    def add(self, word: str) -> bool:
+        """加入關鍵字，已存在或正規化後為空字串回傳 False"""
+        key = normalize(word)
+        if not key or key in self._seen:
+            return False
+        self._seen.add(key)
+        self._keywords.append(word)
+
+        goto = self._goto
+        state = 0
+        for ch in key:
+            nxt = goto[state].get(ch)
+            if nxt is None:
+                nxt = len(goto)
+                goto[state][ch] = nxt
+                goto.append({})
+                self._fail.append(0)
+                self._word.append(None)
+                self._out.append(0)
+            state = nxt
+        self._word[state] = word
+        self._dirty = True
+        return True
+
+    def _build(self):
+        goto, fail, word, out = self._goto, self._fail, self._word, self._out
+        queue = list(goto[0].values())
+        for state in queue:
+            fail[state] = 0
+            out[state] = state if word[state] is not None else 0
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = nxt if word[nxt] is not None else out[fail[nxt]]
+        starts = "".join(re.escape(ch) for ch in goto[0]) or "(?!)"
+        self._start_re = re.compile(f"[{starts}]")
+        self._dirty = False
+
+    def _scan(self, text):
+        """逐字走訪自動機，每命中一次就產生 (位置, 關鍵字結尾狀態)"""
+        if self._dirty:
+            self._build()
+        goto, fail, out = self._goto, self._fail, self._out
+        root = goto[0]
+        state = 0
+        for pos, ch in enumerate(normalize(text)):
+            if state == 0:
+                # 大部分字元不會出現在任何關鍵字開頭，直接略過
+                state = root.get(ch, 0)
+                if not state:
+                    continue
+            else:
+                nxt = goto[state].get(ch)
+                while nxt is None and state:
+                    state = fail[state]
+                    nxt = goto[state].get(ch)
+                state = nxt or 0
+            if out[state]:
+                yield pos, out[state]
+
+    def search(self, text: str):
+        """回傳第一個命中的關鍵字，沒有命中回傳 None"""
+        # on_message 的熱路徑：在根狀態時用正規表示式直接跳到下一個可能的關鍵字開頭
+        if self._dirty:
+            self._build()
+        goto, fail, out = self._goto, self._fail, self._out
+        root = goto[0]
+        find_start = self._start_re.search
+        text = normalize(text)
+        size = len(text)
+        pos = 0
+        state = 0
+        while pos < size:
+            ch = text[pos]
+            if state == 0:
+                match = find_start(text, pos)
+                if match is None:
+                    return None
+                pos = match.start()
+                state = root[text[pos]]
+            else:
+                nxt = goto[state].get(ch)
+                while nxt is None and state:
+                    state = fail[state]
+                    nxt = goto[state].get(ch)
+                state = nxt or 0
+            if out[state]:
+                return self._word[out[state]]
+            pos += 1
+        return None
+
+    def find_all(self, text: str):
+        """回傳所有命中的 (結束位置, 關鍵字)，包含重疊的關鍵字"""
+        hits = []
+        word, fail, out = self._word, self._fail, self._out
+        for pos, state in self._scan(text):
+            while state:
+                hits.append((pos, word[state]))
+                state = out[fail[state]]
+        return hits
@@ -0,0 +1,187 @@
+import asyncio
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qs, urlparse
+
+YTDL_OPTIONS = {
+    'format': 'bestaudio/best',
+    'quiet': True,
+    'no_warnings': True,
+    'noplaylist': False,
+    'default_search': 'ytsearch',
+    'source_address': '0.0.0.0',
+}
+
+DEFAULT_TTL = 1800        # 無法從網址得知到期時間時的快取秒數
+EXPIRE_MARGIN = 120       # 提前這麼多秒視為過期，避免播到一半網址失效
+CACHE_MAX_ENTRIES = 2048
+PLAYLIST_MAX_ENTRIES = 500
+
+def _extract(query, flat):
+    """
+    在子行程中執行 yt-dlp 解析 (阻塞)
+    flat=True 時播放清單只取各項目的網址與標題，不逐一解析串流
+    只回傳需要的欄位，減少跨行程傳輸的資料量
+    """
+    import yt_dlp
+    opts = dict(YTDL_OPTIONS)
+    if flat:
+        opts['extract_flat'] = 'in_playlist'
+        opts['playlistend'] = PLAYLIST_MAX_ENTRIES
+    else:
+        # 單曲解析：網址同時帶有播放清單參數時只取該影片
+        opts['noplaylist'] = True
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(query, download=False)
+
+    entries = info.get('entries')
+    if entries is not None:
+        entries = [e for e in entries if e]
+        if not entries:
+            raise ValueError("找不到任何結果")
+        # 搜尋結果 (ytsearch) 也是以清單回傳，只取第一筆
+        if info.get('extractor_key') == 'YoutubeSearch' or len(entries) == 1:
+            info = entries[0]
+            if info.get('_type') == 'url':
+                return _extract(info['url'], False)
+        else:
+            return {
+                'type': 'playlist',
+                'title': info.get('title') or query,
+                'entries': [{
+                    'webpage_url': e.get('webpage_url') or e.get('url'),
+                    'title': e.get('title') or e.get('url'),
+                    'duration': e.get('duration'),
+                } for e in entries if e.get('webpage_url') or e.get('url')],
+            }
+
+    return {
+        'type': 'track',
+        'webpage_url': info.get('webpage_url') or query,
+        'title': info.get('title') or query,
+        'duration': info.get('duration'),
+        'stream_url': info.get('url'),
+    }
+
+def _warm():
+    return True
+
+def stream_ttl(stream_url, now=None):
+    """依串流網址中的 expire 參數決定快取秒數"""
+    now = now or time.time()
+    try:
+        expire = int(parse_qs(urlparse(stream_url).query)['expire'][0])
+    except (KeyError, ValueError, IndexError):
+        return DEFAULT_TTL
+    return max(expire - now - EXPIRE_MARGIN, 0)
+
+class YTDLResolver:
+    """
+    yt-dlp 非同步解析器
+    * 解析工作丟到行程池，不會卡住 gateway 的事件迴圈
+      行程池在 start() 時就 fork 好，之後不再 fork (有其他執行緒時 fork 可能讓子行程卡在別人持有的鎖上)
+    * 解析結果依串流網址的到期時間快取，重複的歌曲不會再解析一次
+    * 同一個網址同時只會有一個解析工作
+    """
+
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self._pool = None
+        self._cache = OrderedDict()   # 網址 -> (到期時間, 結果)
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        """
+        建立行程池，必須在任何執行緒啟動前呼叫 (bot.py 匯入完模組後立刻呼叫)
+        不用 spawn / forkserver：子行程會重新執行 bot.py 的模組層級程式 (開資料庫、清音檔快取)
+        fork 模式在第一次提交工作時就會建立全部子行程，此時的記憶體只有匯入的模組，沒有成員快取
+        """
+        if self._pool is not None: return
+        self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("fork"))
+        self._pool.submit(_warm).result()
+
+    async def _call(self, query, flat):
+        loop = asyncio.get_running_loop()
+        if self._pool is not None:
+            try:
+                return await loop.run_in_executor(self._pool, _extract, query, flat)
+            except BrokenProcessPool:
+                # 子行程異常結束；這時已有其他執行緒，不再重新 fork，改在執行緒中解析
+                self._pool = None
+        return await loop.run_in_executor(None, _extract, query, flat)
+
+    def _cache_get(self, key):
+        item = self._cache.get(key)
+        if item is None: return None
+        if item[0] <= time.time():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return item[1]
+
+    def _cache_put(self, key, ttl, value):
+        if ttl <= 0: return
+        self._cache[key] = (time.time() + ttl, value)
+        self._cache.move_to_end(key)
+        while len(self._cache) > CACHE_MAX_ENTRIES:
+            self._cache.popitem(last=False)
+
+    def cached_track(self, url):
+        """回傳已解析且尚未過期的歌曲資訊，沒有則回傳 None"""
+        return self._cache_get(("track", url))
+
+    async def _run(self, key, query, flat):
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+        fut = asyncio.ensure_future(self._call(query, flat))
+        self._inflight[key] = fut
+        try:
+            return await fut
+        finally:
+            self._inflight.pop(key, None)
+
+    def _store_track(self, info, *keys):
+        ttl = stream_ttl(info['stream_url']) if info.get('stream_url') else 0
+        for key in keys:
+            self._cache_put(("track", key), ttl, info)
+
+    async def resolve(self, query):
+        """解析使用者輸入的網址或關鍵字，播放清單只展開項目列表"""
+        cached = self._cache_get(("query", query)) or self.cached_track(query)
+        if cached:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        info = await self._run(("query", query), query, True)
+        if info['type'] == 'playlist':
+            self._cache_put(("query", query), DEFAULT_TTL, info)
+        else:
+            self._store_track(info, query, info['webpage_url'])
+        return info
+
+    async def resolve_track(self, url):
+        """取得單一歌曲的串流網址，播放清單中的歌曲在要播放時才解析"""
+        cached = self.cached_track(url)
+        if cached:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        info = await self._run(("track", url), url, False)
+        self._store_track(info, url, info['webpage_url'])
+        return info
+
+    def prefetch(self, url):
+        """在背景先解析下一首"""
+        if self.cached_track(url) or ("track", url) in self._inflight: return
+        task = asyncio.get_running_loop().create_task(self.resolve_track(url))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def shutdown(self):
+        """關閉時結束 yt-dlp 子行程，之後仍有解析請求就改在執行緒中進行"""
+        pool, self._pool = self._pool, None
+        if pool: pool.shutdown(wait=False, cancel_futures=True)